@@ -1,7 +1,10 @@
+import time
+_start = time.perf_counter()
 import streamlit as st
-from database import Database
+from database import get_database
 import views
 import config
+views.record_startup("Module imports", time.perf_counter() - _start)
 
 # Page Configuration
 st.set_page_config(
@@ -11,8 +14,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize Database
-db = Database()
+# Shared Database (schema migrations and admin bootstrap run once per process)
+_start = time.perf_counter()
+db = get_database()
+views.record_startup("Database init", time.perf_counter() - _start)
 
 # --- SESSION STATE MANAGEMENT ---
 if 'page' not in st.session_state: st.session_state.page = 0
@@ -103,7 +108,7 @@ else:
         st.session_state.user_scope = None
         st.rerun()
 
-    if choice == "Dashboard": views.show_dashboard(db, st.session_state.user_scope)
-    elif choice == "Add Asset": views.show_add_asset(db, st.session_state.user_scope)
-    elif choice == "Inventory": views.show_inventory(db, st.session_state.user_scope)
-    elif choice == "Admin": views.show_admin(db, st.session_state.user_scope)
\ No newline at end of file
+    if choice == "Dashboard": views.render_view(choice, views.show_dashboard, db, st.session_state.user_scope)
+    elif choice == "Add Asset": views.render_view(choice, views.show_add_asset, db, st.session_state.user_scope)
+    elif choice == "Inventory": views.render_view(choice, views.show_inventory, db, st.session_state.user_scope)
+    elif choice == "Admin": views.render_view(choice, views.show_admin, db, st.session_state.user_scope)
\ No newline at end of file
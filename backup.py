@@ -0,0 +1,164 @@
+# backup.py
+# Online database backups: the SQLite backup API copies a consistent snapshot in page-sized
+# steps while the app keeps writing, the copy is integrity-checked and gzip-compressed into
+# BACKUP_DIR, and older snapshots are rotated out. Restores go back through the write queue.
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+import config
+from database import SCHEMA_VERSION
+
+HISTORY_FILE = "history.jsonl"
+SUFFIX = ".db.gz"
+COPY_CHUNK = 1048576
+
+def snapshot_prefix():
+    return os.path.splitext(os.path.basename(config.DB_NAME))[0] + "_"
+
+def check_integrity(conn):
+    # Raises ValueError unless PRAGMA integrity_check reports "ok"
+    problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    if problems != ["ok"]:
+        raise ValueError("Integrity check failed: " + "; ".join(problems[:5]))
+
+def copy_database(dest_path, progress=None):
+    # Backup-API copy of the live database into dest_path -> number of pages copied.
+    # The read transaction opened first pins one WAL snapshot for the whole copy, so writes
+    # committed meanwhile neither restart the backup nor end up half-included in it.
+    source = sqlite3.connect(config.DB_NAME, isolation_level=None)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT_MS)}")
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        total = [0]
+
+        def step(status, remaining, pages):
+            total[0] = pages
+            if progress: progress(pages - remaining, pages)
+            if config.BACKUP_STEP_PAUSE: time.sleep(config.BACKUP_STEP_PAUSE)
+
+        source.backup(dest, pages=config.BACKUP_PAGES_PER_STEP, progress=step)
+        source.execute("COMMIT")
+        # A standalone file: no -wal/-shm side files when the snapshot is opened later
+        dest.execute("PRAGMA journal_mode = DELETE").fetchone()
+        check_integrity(dest)
+        return total[0]
+    finally:
+        dest.close()
+        source.close()
+
+def create_backup(label="manual", progress=None):
+    # Writes BACKUP_DIR/<db>_<timestamp>_<label>.db.gz and rotates old snapshots.
+    # Returns {"path", "label", "pages", "db_bytes", "bytes", "seconds", "deleted"}.
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+    start = time.perf_counter()
+    stem = f"{snapshot_prefix()}{datetime.now().strftime('%Y%m%d_%H%M%S')}_{label}"
+    name, n = stem + SUFFIX, 1
+    while os.path.exists(os.path.join(config.BACKUP_DIR, name)):
+        n += 1
+        name = f"{stem}-{n}{SUFFIX}"
+    path = os.path.join(config.BACKUP_DIR, name)
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=config.BACKUP_DIR)
+    os.close(fd)
+    packed = None
+    try:
+        pages = copy_database(raw, progress)
+        db_bytes = os.path.getsize(raw)
+        # Compress to a temporary name first so a partial .gz never looks like a snapshot
+        fd, packed = tempfile.mkstemp(suffix=".part", dir=config.BACKUP_DIR)
+        with open(raw, "rb") as src, os.fdopen(fd, "wb") as out:
+            with gzip.GzipFile(filename=name[:-3], mode="wb", fileobj=out, compresslevel=config.BACKUP_COMPRESS_LEVEL) as gz:
+                shutil.copyfileobj(src, gz, COPY_CHUNK)
+        os.replace(packed, path)
+    finally:
+        for leftover in (raw, packed):
+            if leftover and os.path.exists(leftover): os.remove(leftover)
+
+    report = {"path": path, "label": label, "pages": pages, "db_bytes": db_bytes,
+              "bytes": os.path.getsize(path), "seconds": round(time.perf_counter() - start, 3),
+              "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    record_run(report)
+    report["deleted"] = rotate()
+    return report
+
+def record_run(report):
+    with open(os.path.join(config.BACKUP_DIR, HISTORY_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps({k: report[k] for k in ["path", "label", "pages", "db_bytes", "bytes", "seconds", "created"]}) + "\n")
+
+def run_history():
+    # path -> recorded run report
+    history = {}
+    try:
+        with open(os.path.join(config.BACKUP_DIR, HISTORY_FILE), encoding="utf-8") as f:
+            for line in f:
+                try: run = json.loads(line)
+                except ValueError: continue
+                history[os.path.basename(run["path"])] = run
+    except FileNotFoundError:
+        pass
+    return history
+
+def list_backups():
+    # Snapshots in BACKUP_DIR, newest first, with the duration and size of the run that made them
+    if not os.path.isdir(config.BACKUP_DIR): return []
+    history = run_history()
+    rows = []
+    for name in os.listdir(config.BACKUP_DIR):
+        if not (name.startswith(snapshot_prefix()) and name.endswith(SUFFIX)): continue
+        path = os.path.join(config.BACKUP_DIR, name)
+        run = history.get(name, {})
+        mtime = os.path.getmtime(path)
+        rows.append({"Name": name, "Created": datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                     "Label": run.get("label", ""), "MB": round(os.path.getsize(path) / 1048576, 2),
+                     "DB MB": round(run["db_bytes"] / 1048576, 2) if "db_bytes" in run else None,
+                     "Seconds": run.get("seconds"), "path": path, "mtime": mtime})
+    return sorted(rows, key=lambda r: (r["mtime"], r["Name"]), reverse=True)
+
+def rotate(keep=None):
+    # Deletes all but the newest `keep` snapshots -> names deleted
+    keep = config.BACKUP_KEEP if keep is None else keep
+    deleted = []
+    for row in list_backups()[keep:]:
+        os.remove(row["path"])
+        deleted.append(row["Name"])
+    return deleted
+
+def restore_backup(db, path, progress=None):
+    # Replaces the live database with a snapshot. The snapshot is unpacked and checked first,
+    # the current state is saved as a "pre-restore" snapshot, and the copy runs as a writer job
+    # so queued writes wait for it instead of failing on the lock.
+    start = time.perf_counter()
+    fd, raw = tempfile.mkstemp(suffix=".db", dir=config.BACKUP_DIR)
+    os.close(fd)
+    try:
+        with gzip.open(path, "rb") as src, open(raw, "wb") as out:
+            shutil.copyfileobj(src, out, COPY_CHUNK)
+        snapshot = sqlite3.connect(raw, check_same_thread=False)
+        try:
+            check_integrity(snapshot)
+            version = snapshot.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise ValueError(f"Snapshot is schema version {version}; this app only knows up to {SCHEMA_VERSION}")
+            safety = create_backup("pre-restore")
+
+            def job(session):
+                live = session.connection().connection.driver_connection
+                snapshot.backup(live, pages=config.BACKUP_PAGES_PER_STEP,
+                                progress=(lambda status, remaining, pages: progress(pages - remaining, pages)) if progress else None)
+            db.write(job)
+        finally:
+            snapshot.close()
+    finally:
+        os.remove(raw)
+    # Older snapshots are brought up to the current schema
+    migrations = db.migrate()
+    db.cache.clear()
+    db.queue_missing_thumbnails()
+    return {"path": path, "safety": safety["path"], "migrations": migrations,
+            "seconds": round(time.perf_counter() - start, 3)}
@@ -0,0 +1,87 @@
+# bench_decoder.py
+# Decode rate and latency of decoder.decode_frame against the old single-shot pyzbar call.
+#   python bench_decoder.py fixtures/frames            (captured .jpg/.png frames)
+#   python bench_decoder.py --synthetic 200            (generated QR frames, optionally saved with --save)
+# A frame's expected payload is taken from its file name up to the first "__" (e.g. SN123__blurry.jpg).
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from pyzbar import pyzbar
+import config
+import decoder
+
+def load_fixtures(folder):
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() not in (".jpg", ".jpeg", ".png", ".bmp"): continue
+        with open(os.path.join(folder, name), "rb") as f:
+            frames.append((name.split("__")[0].rsplit(".", 1)[0], f.read()))
+    return frames
+
+def synthetic_frames(count, seed=0):
+    # QR labels pasted into noisy, blurred, tilted 1920x1080 "camera" frames
+    import qrcode
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        serial = f"SN{rng.integers(10**6, 10**7)}"
+        qr = qrcode.QRCode(box_size=int(rng.integers(3, 9)), border=2)
+        qr.add_data(serial)
+        qr.make(fit=True)
+        code = np.array(qr.make_image(fill_color="black", back_color="white").convert("L"))
+        frame = np.full((1080, 1920), int(rng.integers(90, 200)), np.uint8)
+        h, w = code.shape
+        y, x = int(rng.integers(0, 1080 - h)), int(rng.integers(0, 1920 - w))
+        frame[y:y + h, x:x + w] = code
+        tilt = cv2.getRotationMatrix2D((x + w / 2, y + h / 2), float(rng.uniform(-20, 20)), 1.0)
+        frame = cv2.warpAffine(frame, tilt, (1920, 1080), borderValue=128)
+        frame = cv2.GaussianBlur(frame, (0, 0), float(rng.uniform(0.3, 1.6)))
+        frame = np.clip(frame + rng.normal(0, rng.uniform(2, 12), frame.shape), 0, 255).astype(np.uint8)
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(55, 90))])
+        frames.append((serial, jpeg.tobytes()))
+    return frames
+
+def baseline(frame_bytes):
+    # What show_inventory did before: full-resolution colour frame straight into pyzbar
+    image = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return [(o.data.decode("utf-8", "replace"), o.type) for o in pyzbar.decode(image)]
+
+def run(label, frames, fn):
+    latencies, hits, stages = [], 0, {}
+    for expected, data in frames:
+        start = time.perf_counter()
+        out = fn(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+        codes, stage = (out["codes"], out["stage"]) if isinstance(out, dict) else (out, "single")
+        if any(c[0] == expected for c in codes):
+            hits += 1
+            stages[stage] = stages.get(stage, 0) + 1
+    lat = np.array(latencies)
+    print(f"{label:10} decoded {hits}/{len(frames)} ({hits / len(frames):.1%})  "
+          f"p50 {np.percentile(lat, 50):.1f} ms  p95 {np.percentile(lat, 95):.1f} ms  mean {lat.mean():.1f} ms")
+    if len(stages) > 1 or "single" not in stages:
+        print("           hits by stage: " + ", ".join(f"{k} {v}" for k, v in sorted(stages.items(), key=lambda kv: -kv[1])))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the staged webcam decoder")
+    parser.add_argument("folder", nargs="?", default=os.path.join("fixtures", "frames"))
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N frames instead of reading a folder")
+    parser.add_argument("--save", action="store_true", help="write generated frames into the folder")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        frames = synthetic_frames(args.synthetic)
+        if args.save:
+            os.makedirs(args.folder, exist_ok=True)
+            for i, (serial, data) in enumerate(frames):
+                with open(os.path.join(args.folder, f"{serial}__synthetic{i:04d}.jpg"), "wb") as f: f.write(data)
+    else:
+        frames = load_fixtures(args.folder)
+    if not frames:
+        raise SystemExit(f"No frames found in {args.folder} (use --synthetic N to generate some)")
+
+    print(f"{len(frames)} frames, symbologies: {', '.join(config.SCAN_SYMBOLOGIES)}")
+    run("baseline", frames, baseline)
+    run("staged", frames, decoder.decode_frame)
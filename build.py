@@ -22,6 +22,11 @@ if __name__ == '__main__':
         '--add-data=views.py;.',
         '--add-data=database.py;.',
         '--add-data=config.py;.',
+        '--add-data=labels.py;.',
+        '--add-data=depreciation.py;.',
+        '--add-data=decoder.py;.',
+        '--add-data=exporter.py;.',
+        '--add-data=backup.py;.',
         
         # Collect heavy libraries
         '--collect-all=streamlit',
@@ -4,6 +4,97 @@ APP_VERSION = "3.6 by Config Mang"
 # Database
 DB_NAME = "asset_manager.db"
 
+# Attachment store (content-addressed, sharded by hash)
+ATTACHMENTS_DIR = "attachments"
+THUMBNAIL_SIZE = 256              # longest side of generated previews (px)
+
+# SQLite engine profile (applied to every new connection)
+DB_JOURNAL_MODE = "WAL"           # readers don't block the writer and vice versa
+DB_SYNCHRONOUS = "NORMAL"         # safe with WAL; FULL fsyncs every commit
+DB_BUSY_TIMEOUT_MS = 5000         # wait this long on a lock before "database is locked"
+DB_CACHE_SIZE_KB = 65536          # page cache per connection
+DB_MMAP_SIZE = 268435456          # 256 MB memory-mapped reads
+DB_TEMP_STORE = "MEMORY"
+DB_AUTO_VACUUM = "INCREMENTAL"    # existing files are converted by one VACUUM (schema migration 10)
+
+# Single-writer queue: all writes run on one thread, queued writes share a commit
+DB_WRITE_QUEUE = True
+DB_WRITE_BATCH_MAX = 64
+
+# Scheduled maintenance intervals in seconds (0 disables a task)
+MAINT_TICK_SECONDS = 30
+MAINT_SCAN_COMPACT_INTERVAL = 60  # fold scan_events into assets.last_scanned
+MAINT_SCAN_PRUNE_INTERVAL = 86400 # roll old scan_events up into scan_daily
+MAINT_OPTIMIZE_INTERVAL = 3600    # PRAGMA optimize
+MAINT_ANALYZE_INTERVAL = 86400    # ANALYZE
+MAINT_VACUUM_INTERVAL = 21600     # PRAGMA incremental_vacuum
+MAINT_VACUUM_PAGES = 2000
+
+# Read-through query cache shared by all sessions; cleared on every write
+CACHE_MAX_ENTRIES = 512
+CACHE_MAX_MB = 64
+
+# Filtered counts above this are shown as "N+" instead of counting every match
+COUNT_ESTIMATE_OVER = 10000
+
+# Admin bulk editor: assets per grid window (pending edits are kept across windows until saved)
+BULK_EDIT_WINDOW = 200
+
+# Assets not scanned for this many days are flagged as stale
+STALE_AFTER_DAYS = 180
+
+# Scan journal retention: older events are kept only as per-day room totals (scan_daily)
+SCAN_RETENTION_DAYS = 365
+
+# Inventory scans are buffered and flushed in one lookup when either limit is hit
+SCAN_FLUSH_SIZE = 25
+SCAN_FLUSH_SECONDS = 2
+
+# Webcam decoding: symbologies to look for, working size for the fast stages, ROI attempts
+SCAN_SYMBOLOGIES = ["QRCODE", "CODE128", "CODE39", "EAN13", "EAN8", "UPCA", "I25"]
+DECODE_MAX_SIDE = 960
+DECODE_ROI_LIMIT = 4
+
+# Batch ingestion (photo ZIPs / videos): frame sampling and the decode process pool
+INGEST_VIDEO_STEP_SECONDS = 0.5
+INGEST_MAX_FRAMES = 2000
+INGEST_POOL_WORKERS = None        # None = one per CPU, 1 = decode in-process
+INGEST_IN_FLIGHT = 32             # frames queued to the pool at once
+
+# Bulk import: rows per transaction
+IMPORT_CHUNK_SIZE = 5000
+
+# Exports stream to files in EXPORT_DIR; smaller ones are also offered as a browser download
+EXPORT_DIR = "exports"
+EXPORT_KEEP = 10                  # newest export files kept in EXPORT_DIR; older ones are deleted
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_PARQUET_COMPRESSION = "zstd"
+EXPORT_XLSX_MAX_ROWS = 1048575    # Excel's sheet limit minus the header row
+EXPORT_DOWNLOAD_MAX_MB = 25      # st.download_button holds the whole file in memory (exports and backup snapshots); bigger files stay on disk
+
+# Online backups: gzip snapshots in BACKUP_DIR, copied with the SQLite backup API in steps
+# of BACKUP_PAGES_PER_STEP pages (pausing BACKUP_STEP_PAUSE seconds between steps)
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 14                  # newest snapshots kept; older ones are deleted after each run
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_PAUSE = 0.0
+BACKUP_COMPRESS_LEVEL = 6
+
+# QR sticker sheets: encoded codes are cached per serial; big batches encode in a process pool
+QR_CACHE_SIZE = 20000
+QR_POOL_THRESHOLD = 500
+QR_POOL_WORKERS = None            # None = one per CPU, 1 = never use the pool
+
+# Depreciation: useful life in years per device type (others use the default)
+DEPRECIATION_METHOD = "straight_line"   # or "declining_balance"
+DEPRECIATION_LIFE_YEARS = {"Laptop": 4, "Desktop": 5, "Monitor": 6, "Printer": 5, "Server": 6, "Network": 7, "Phone": 3, "Tablet": 3}
+DEPRECIATION_DEFAULT_LIFE = 5
+DEPRECIATION_SALVAGE_PCT = 0.0
+DECLINING_BALANCE_FACTOR = 2.0          # 2.0 = double-declining balance
+
+# Handover form PDFs kept in memory (keyed by asset, assignee and last edit)
+HANDOVER_CACHE_SIZE = 500
+
 # Scopes / Permissions
 SCOPE_ADMIN = "Admin"             # Full Access
 SCOPE_READ_WRITE = "Read/Write"   # Can add/edit/scan, cannot manage users
@@ -1,7 +1,25 @@
 import sqlite3
+import threading
+import queue
+import time
+import io
+import csv
+import re
+import os
+import sys
+import hashlib
+import mimetypes
+import tempfile
+import functools
+from collections import OrderedDict
 import bcrypt
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, or_, desc
+import numpy as np
+import pandas as pd
+from datetime import datetime, date, timedelta
+from concurrent.futures import Future
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Table, Index, or_, desc, text, select, func, inspect, tuple_
+from sqlalchemy import bindparam, event, literal, literal_column, case, type_coerce, LargeBinary
+from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
 import config
 
@@ -26,6 +44,74 @@ class Transaction(Base):
     timestamp = Column(DateTime, default=datetime.now)
     asset = relationship("Asset", back_populates="transactions")
 
+# Append-only scan journal. Only the rowid, an (asset_id, scanned_at) index and a scanned_at
+# index (SCAN_DDL) are maintained, so each beep is a cheap append; compact_scans_job folds it
+# into assets and prune_scans_job rolls old events up into scan_daily.
+class ScanEvent(Base):
+    __tablename__ = 'scan_events'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    asset_id = Column(Integer)  # NULL when the serial was unknown; no FK so inserts skip the lookup
+    serial = Column(String, nullable=False)
+    user_name = Column(String)
+    scanned_at = Column(DateTime, nullable=False)
+    source = Column(String)
+    __table_args__ = (Index('ix_scan_events_asset_time', 'asset_id', 'scanned_at'),)
+
+# Attachment metadata; file bodies live in a content-addressed store (see blob_path), so
+# identical uploads share one file and listing an asset's files is an index lookup.
+class Attachment(Base):
+    __tablename__ = 'attachments'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    asset_id = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False)
+    mime = Column(String)
+    created = Column(DateTime, nullable=False)
+    user_name = Column(String)
+    __table_args__ = (Index('ix_attachments_asset_name', 'asset_id', 'name', unique=True),
+                      Index('ix_attachments_sha256', 'sha256'))
+
+# One preview per distinct file content, kept in the database next to the attachment index.
+# status: "ok" (data holds a JPEG), "unsupported" (no renderer for this type) or "error".
+class AttachmentThumb(Base):
+    __tablename__ = 'attachment_thumbs'
+    sha256 = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    width = Column(Integer)
+    height = Column(Integer)
+    data = Column(LargeBinary)
+    created = Column(DateTime, nullable=False)
+
+# Per-day scan totals per room for events past config.SCAN_RETENTION_DAYS. Location is the
+# asset's location when the day was rolled up.
+class ScanDaily(Base):
+    __tablename__ = 'scan_daily'
+    day = Column(String, primary_key=True)
+    building = Column(String, primary_key=True)
+    room = Column(String, primary_key=True)
+    scans = Column(Integer, nullable=False)
+    assets = Column(Integer, nullable=False)
+
+class AppMeta(Base):
+    __tablename__ = 'app_meta'
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+# Normalized tags: one row per tag name, asset_tags links them to assets.
+# The (tag_id, asset_id) index serves "assets with tag X" lookups; the PK serves the reverse.
+asset_tags = Table(
+    'asset_tags', Base.metadata,
+    Column('asset_id', Integer, ForeignKey('assets.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_asset_tags_tag_asset', 'tag_id', 'asset_id')
+)
+
+class Tag(Base):
+    __tablename__ = 'tags'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
+
 class Asset(Base):
     __tablename__ = 'assets'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -44,11 +130,13 @@ class Asset(Base):
     table_num = Column(String)
     assigned_to = Column(String)
     tags = Column(String)
-    date_added = Column(String)
-    last_modified = Column(String)
-    last_scanned = Column(String)
+    date_added = Column(DateTime)
+    last_modified = Column(DateTime)
+    last_scanned = Column(DateTime)  # NULL = never scanned
     
     transactions = relationship("Transaction", order_by=Transaction.id, back_populates="asset")
+    # Asset.tags stays as the display string; tag_links is the indexed source for filtering
+    tag_links = relationship("Tag", secondary=asset_tags)
 
     def to_dict(self):
         return {
@@ -72,28 +160,860 @@ class Asset(Base):
             "Last Scanned": self.last_scanned
         }
 
+# Export column order matches Asset.to_dict
+EXPORT_COLUMNS = [
+    ("ID", Asset.id), ("Type", Asset.device_type), ("Make", Asset.make), ("Model", Asset.model),
+    ("Serial", Asset.serial_number), ("Stock", Asset.stock_number), ("ITEC", Asset.itec_account),
+    ("Price", Asset.aqs_price), ("Building", Asset.building), ("Room", Asset.room), ("Rack", Asset.rack),
+    ("Row", Asset.row), ("Table", Asset.table_num), ("Assigned To", Asset.assigned_to), ("Tags", Asset.tags),
+    ("Date Added", Asset.date_added), ("Last Modified", Asset.last_modified), ("Last Scanned", Asset.last_scanned),
+]
+
+# --- SEARCH INDEX (FTS5) ---
+# External-content FTS table over the searchable asset columns, kept in sync by triggers.
+# prefix='2 3' builds prefix indexes so "lat*" style lookups don't scan the term list.
+SEARCH_COLUMNS = ["make", "model", "serial_number", "device_type", "assigned_to"]
+_cols = ", ".join(SEARCH_COLUMNS)
+_new_cols = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+_old_cols = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+
+SEARCH_INDEX_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS assets_fts USING fts5({_cols}, content='assets', content_rowid='id', prefix='2 3', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS assets_fts_ai AFTER INSERT ON assets BEGIN "
+    f"INSERT INTO assets_fts(rowid, {_cols}) VALUES (new.id, {_new_cols}); END",
+    f"CREATE TRIGGER IF NOT EXISTS assets_fts_ad AFTER DELETE ON assets BEGIN "
+    f"INSERT INTO assets_fts(assets_fts, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols}); END",
+    f"CREATE TRIGGER IF NOT EXISTS assets_fts_au AFTER UPDATE OF {_cols} ON assets BEGIN "
+    f"INSERT INTO assets_fts(assets_fts, rowid, {_cols}) VALUES ('delete', old.id, {_old_cols}); "
+    f"INSERT INTO assets_fts(rowid, {_cols}) VALUES (new.id, {_new_cols}); END",
+]
+
+# bm25 column weights, same order as SEARCH_COLUMNS (serial hits rank highest)
+SEARCH_WEIGHTS = "2.0, 2.0, 5.0, 1.0, 1.0"
+
+def build_match_query(search_query):
+    # Every word becomes a quoted prefix phrase; FTS5 ANDs them together.
+    phrases = []
+    for term in search_query.split():
+        if any(ch.isalnum() for ch in term):
+            phrases.append('"' + term.replace('"', '""') + '"*')
+    return " ".join(phrases)
+
+def unindexed_terms(search_query):
+    # Words with no letters or digits ("-", "#", '"') have no FTS tokens; they keep the substring filter
+    return [term for term in search_query.split() if not any(ch.isalnum() for ch in term)]
+
+# Running totals per device type, maintained by the triggers in STATS_DDL.
+# NULL types are keyed as '' so they still count toward the totals.
+class AssetTypeStats(Base):
+    __tablename__ = 'asset_type_stats'
+    device_type = Column(String, primary_key=True)
+    asset_count = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+# --- SUMMARY STATS TRIGGERS ---
+UNIX_EPOCH_JD = 2440587.5  # julianday('1970-01-01')
+
+def _price_sql(ref):
+    # Imported prices can be stray text; only numeric values count toward value
+    return f"(CASE WHEN typeof({ref}.aqs_price) IN ('integer', 'real') THEN {ref}.aqs_price ELSE 0 END)"
+
+_STATS_ADD = (
+    "INSERT INTO asset_type_stats(device_type, asset_count, total_value) "
+    "VALUES (coalesce(new.device_type, ''), 1, {price}) "
+    "ON CONFLICT(device_type) DO UPDATE SET asset_count = asset_count + 1, total_value = total_value + excluded.total_value;"
+).format(price=_price_sql("new"))
+_STATS_REMOVE = (
+    "UPDATE asset_type_stats SET asset_count = asset_count - 1, total_value = total_value - {price} "
+    "WHERE device_type = coalesce(old.device_type, ''); "
+    "DELETE FROM asset_type_stats WHERE device_type = coalesce(old.device_type, '') AND asset_count <= 0;"
+).format(price=_price_sql("old"))
+
+STATS_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS asset_stats_ai AFTER INSERT ON assets BEGIN {_STATS_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS asset_stats_ad AFTER DELETE ON assets BEGIN {_STATS_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS asset_stats_au AFTER UPDATE OF device_type, aqs_price ON assets BEGIN {_STATS_REMOVE} {_STATS_ADD} END",
+]
+
+# --- KEYSET PAGINATION ---
+# Sortable dashboard columns. Nullable ones sort on coalesce(...) so the seek
+# comparison never meets a NULL; each has a matching (key, id) index below. The ''
+# is written inline: as a bound parameter SQLite can't match the expression index.
+EMPTY = literal_column("''")
+SORT_KEYS = {
+    "ID": Asset.id,
+    "Serial": Asset.serial_number,
+    "Building": Asset.building,
+    "Type": func.coalesce(Asset.device_type, EMPTY),
+    "Make": func.coalesce(Asset.make, EMPTY),
+    # Raw text so a NULL date sorts (and round-trips in the cursor) as ''
+    "Date Added": type_coerce(func.coalesce(Asset.date_added, EMPTY), String),
+}
+
+PAGINATION_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_assets_seek_serial ON assets(serial_number, id)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_seek_building ON assets(building, id)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_seek_type ON assets(coalesce(device_type, ''), id)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_seek_make ON assets(coalesce(make, ''), id)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_seek_date_added ON assets(coalesce(date_added, ''), id)",
+]
+
+# --- TIMESTAMPS ---
+TIMESTAMP_COLUMNS = ["date_added", "last_modified", "last_scanned"]
+# Range filters ("added this month", "not scanned in N days", health per building)
+TIMESTAMP_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_assets_date_added ON assets(date_added)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_last_scanned ON assets(last_scanned)",
+    "CREATE INDEX IF NOT EXISTS ix_assets_building_scanned ON assets(building, last_scanned)",
+]
+# Covering index for the dashboard's Type -> Make breakdown
+ANALYTICS_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_assets_type_make ON assets(device_type, make)",
+]
+# Depreciation inputs: grouped by type and building in index order, read without touching the table
+DEPRECIATION_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_assets_depreciation ON assets(device_type, building, date_added, aqs_price)",
+]
+# Scan activity reports read a time range of the journal
+SCAN_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_scan_events_time ON scan_events(scanned_at)",
+]
+# Batch handover forms by assignee
+CUSTODY_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_assets_assigned_to ON assets(assigned_to)",
+]
+_D = "[0-9]"
+DATE_GLOB = f"{_D*4}-{_D*2}-{_D*2}"
+DATETIME_GLOB = f"{DATE_GLOB} {_D*2}:{_D*2}:{_D*2}"
+STORED_GLOB = f"{DATETIME_GLOB}.{_D*6}"  # what SQLAlchemy's SQLite DateTime writes
+TIMESTAMP_FORMATS = ["%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y"]
+
+def parse_timestamp(value):
+    # datetime / date / text -> datetime; blank and "Never" -> None; raises ValueError otherwise
+    if value is None: return None
+    if isinstance(value, datetime): return value
+    if isinstance(value, date): return datetime.combine(value, datetime.min.time())
+    text_value = str(value).strip()
+    if not text_value or text_value == "Never": return None
+    try: return datetime.fromisoformat(text_value)
+    except ValueError: pass
+    for fmt in TIMESTAMP_FORMATS:
+        try: return datetime.strptime(text_value, fmt)
+        except ValueError: pass
+    raise ValueError(f"Unrecognised date: {text_value}")
+
+# --- AUDIT LOG INDEXES ---
+# Each audit filter gets a (filter, timestamp, id) index so filtered pages are a seek
+AUDIT_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_transactions_time ON transactions(timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_asset_time ON transactions(asset_id, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_user_time ON transactions(user_name, timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_action_time ON transactions(action, timestamp, id)",
+]
+
+# --- DATA REVISION ---
+# Process-wide counter bumped by every committed write; read paths key caches on it.
+_revision_lock = threading.Lock()
+_revision = 0
+
+def bump_revision():
+    global _revision
+    with _revision_lock:
+        _revision += 1
+
+def current_revision():
+    return _revision
+
+# --- QUERY CACHE ---
+def payload_size(value):
+    # Rough byte size of a cached result, used for the memory bound
+    if hasattr(value, "memory_usage"): return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (str, bytes)): return sys.getsizeof(value)
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)): return sys.getsizeof(value) + sum(payload_size(v) for v in value)
+    return sys.getsizeof(value)
+
+def freeze(value):
+    # Hashable form of call arguments (lists -> tuples, dicts -> sorted item tuples)
+    if isinstance(value, (list, tuple, set)): return tuple(freeze(v) for v in value)
+    if isinstance(value, dict): return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    return value
+
+class QueryCache:
+    # LRU of read results keyed on (name, args). Every entry belongs to the data revision it was
+    # read at; the first lookup after a write drops the lot, so invalidation is implicit.
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.revision = current_revision()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def sync(self):
+        revision = current_revision()
+        if revision != self.revision:
+            if self.entries: self.stats["invalidations"] += 1
+            self.entries.clear()
+            self.bytes = 0
+            self.revision = revision
+        return revision
+
+    def get_or_load(self, key, loader):
+        with self.lock:
+            revision = self.sync()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key][0]
+            self.stats["misses"] += 1
+
+        value = loader()
+        size = payload_size(value)
+        with self.lock:
+            # Drop results that raced a write, and anything too big to be worth keeping
+            if self.sync() != revision or size > self.max_bytes: return value
+            if key in self.entries: self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def info(self):
+        with self.lock:
+            self.sync()
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self.entries), "bytes": self.bytes, "revision": self.revision,
+                    "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
+
+def cached_query(method):
+    # Database read methods: results are shared across sessions until the next write.
+    # Callers must treat the returned objects as read-only.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, freeze(args), freeze(kwargs))
+        try: hash(key)
+        except TypeError: return method(self, *args, **kwargs)
+        return self.cache.get_or_load(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+# --- TAG HELPERS ---
+def parse_tags(tag_value):
+    # "Lab, Lab2,,Lab" -> ["Lab", "Lab2"] (order kept, blanks and repeats dropped)
+    if not tag_value or not isinstance(tag_value, str): return []
+    names = []
+    for t in tag_value.split(','):
+        t = t.strip()
+        if t and t not in names: names.append(t)
+    return names
+
+def tag_names(tag_filter):
+    # Accepts a single tag, a list of tags, or the "All" / None sentinels
+    if not tag_filter or tag_filter == "All": return []
+    if isinstance(tag_filter, str): return [tag_filter]
+    return [t for t in tag_filter if t and t != "All"]
+
+def tag_filter_clause(names, tag_mode="any"):
+    matches = select(asset_tags.c.asset_id).join(Tag, Tag.id == asset_tags.c.tag_id).where(Tag.name.in_(names))
+    if tag_mode == "all" and len(names) > 1:
+        matches = matches.group_by(asset_tags.c.asset_id).having(func.count() == len(names))
+    return Asset.id.in_(matches)
+
+# --- UI <-> MODEL MAPPING ---
+# FIX IMPLEMENTED: Mapping UI headers to DB columns
+UI_TO_MODEL_MAP = {
+    "Type": "device_type",
+    "Make": "make",
+    "Model": "model",
+    "Serial": "serial_number",
+    "Stock": "stock_number",
+    "ITEC": "itec_account",
+    "Price": "aqs_price",
+    "Building": "building",
+    "Room": "room",
+    "Rack": "rack",
+    "Row": "row",
+    "Table": "table_num",
+    "Assigned To": "assigned_to",
+    "Tags": "tags",
+    "Last Scanned": "last_scanned"
+}
+REQUIRED_FIELDS = ["Serial", "Building", "Room"]
+
+def plain_value(value):
+    # numpy/pandas scalars -> Python, NaN/NaT -> None (sqlite3 can't bind either)
+    if hasattr(value, "to_pydatetime"): value = value.to_pydatetime()
+    elif hasattr(value, "item"): value = value.item()
+    if value is None or value != value: return None
+    return value
+
+def diff_asset_frames(original, edited):
+    # Compares two grid frames keyed on "ID" and returns {asset_id: {ui_column: new_value}}
+    # for the cells that actually changed. Rows missing from `edited` are ignored.
+    cols = [c for c in edited.columns if c in UI_TO_MODEL_MAP and c in original.columns]
+    before = original.set_index("ID")[cols]
+    after = edited.set_index("ID")[cols].reindex(before.index)
+    changed = (before != after) & ~(before.isna() & after.isna())
+    row_idx, col_idx = changed.to_numpy().nonzero()
+    changes = {}
+    for r, c in zip(row_idx, col_idx):
+        changes.setdefault(int(before.index[r]), {})[cols[c]] = plain_value(after.iat[r, c])
+    return changes
+
+# --- BULK IMPORT HELPERS ---
+# Import file header (lowercased) -> Asset column
+IMPORT_COLUMNS = {
+    "type": "device_type", "make": "make", "model": "model", "serial": "serial_number",
+    "stock": "stock_number", "itec": "itec_account", "price": "aqs_price",
+    "building": "building", "room": "room", "class": "classification",
+    "rack": "rack", "row": "row", "table": "table_num", "assigned": "assigned_to", "tags": "tags",
+}
+IMPORT_DEFAULTS = {
+    "device_type": "Unknown", "make": "Gen", "model": "Gen", "building": "Main", "room": "000",
+    "classification": "Imported", "assigned_to": "Available", "aqs_price": 0.0,
+}
+SQL_IN_BATCH = 500  # keeps IN (...) lists well under SQLite's bound-parameter limit
+
+def iter_import_rows(file_obj, file_name):
+    # Streams (row_number, {header: value}) from a CSV or XLSX upload without loading it whole
+    if file_name.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(file_obj, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h).lower().strip() if h is not None else "" for h in next(rows, [])]
+        for n, values in enumerate(rows, start=2):
+            if any(v is not None and v != "" for v in values):
+                yield n, dict(zip(header, values))
+        wb.close()
+    else:
+        reader = csv.reader(io.TextIOWrapper(file_obj, encoding="utf-8-sig", newline=""))
+        header = [h.lower().strip() for h in next(reader, [])]
+        for n, values in enumerate(reader, start=2):
+            if any(v.strip() for v in values):
+                yield n, dict(zip(header, values))
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk: yield chunk
+
+def clean_cell(value):
+    if value is None: return ""
+    if isinstance(value, float) and value.is_integer(): value = int(value)  # Excel numeric serials
+    return str(value).strip()
+
+def parse_price(value):
+    if value is None or value == "": return 0.0
+    if isinstance(value, (int, float)): return float(value)
+    clean = re.sub(r'[^\d.]', '', str(value))
+    if not re.search(r'\d', clean):
+        # Blank means no price; text with no digits at all ("abc", "TBD") is an error, not $0
+        if str(value).strip(): raise ValueError(f"Invalid price: {value!r}")
+        return 0.0
+    return float(clean)
+
+# --- ENGINE PROFILE ---
+def connection_pragmas():
+    return [
+        # auto_vacuum must precede journal_mode, which initialises a new file; it is ignored on existing ones
+        f"PRAGMA auto_vacuum = {config.DB_AUTO_VACUUM}",
+        f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}",
+        f"PRAGMA cache_size = -{int(config.DB_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}",
+        f"PRAGMA temp_store = {config.DB_TEMP_STORE}",
+    ]
+
+def apply_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    for pragma in connection_pragmas():
+        cursor.execute(pragma)
+    cursor.close()
+
+# --- SINGLE WRITER QUEUE ---
+def changed_data(changes_data, result):
+    # changes_data is a flag, or a predicate on the job's result for jobs that only
+    # sometimes touch asset data (e.g. a compaction that found nothing to roll up)
+    return changes_data(result) if callable(changes_data) else changes_data
+
+class WriteQueue:
+    # All writes run as job(session) on one thread. Jobs queued while a commit is in
+    # flight are committed together, so bursts of small writes (scans, check-ins)
+    # share one transaction instead of fighting over the SQLite write lock.
+    def __init__(self, engine, batch_max, threaded=True):
+        self.Session = sessionmaker(bind=engine)
+        self.batch_max = batch_max
+        self.jobs = queue.Queue()
+        self.stats = {"jobs": 0, "batches": 0, "replays": 0}
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self.run, name="db-writer", daemon=True)
+            self.thread.start()
+
+    def submit(self, job, changes_data=True):
+        if self.thread is None or threading.current_thread() is self.thread:
+            return self.run_one(job, changes_data)
+        future = Future()
+        self.jobs.put((job, changes_data, future))
+        return future.result()
+
+    def run(self):
+        while True:
+            batch = [self.jobs.get()]
+            while len(batch) < self.batch_max:
+                try: batch.append(self.jobs.get_nowait())
+                except queue.Empty: break
+            self.run_batch(batch)
+
+    def run_batch(self, batch):
+        self.stats["batches"] += 1
+        self.stats["jobs"] += len(batch)
+        session = self.Session()
+        try:
+            results = [job(session) for job, _, _ in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            results, error = None, e
+        finally:
+            session.close()
+
+        if results is not None:
+            if any(changed_data(changes, result) for (_, changes, _), result in zip(batch, results)): bump_revision()
+            for (_, _, future), result in zip(batch, results): future.set_result(result)
+        elif len(batch) == 1:
+            batch[0][2].set_exception(error)
+        else:
+            # One job failed: replay each on its own so the others still land
+            self.stats["replays"] += 1
+            for job, changes, future in batch:
+                try: future.set_result(self.run_one(job, changes))
+                except Exception as e: future.set_exception(e)
+
+    def run_one(self, job, changes_data=True):
+        session = self.Session()
+        try:
+            result = job(session)
+            session.commit()
+            if changed_data(changes_data, result): bump_revision()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+# --- SCHEDULED MAINTENANCE ---
+def pragma_job(sql_fn):
+    def job(session):
+        result = session.connection().exec_driver_sql(sql_fn())
+        if result.returns_rows: result.fetchall()
+    return job
+
+def compact_scans_job(session):
+    # Rolls the newest scan per asset since the last compaction into assets.last_scanned.
+    # The watermark is the last scan_events.id already applied, so each event is read once.
+    conn = session.connection()
+    mark = int(conn.execute(select(AppMeta.value).where(AppMeta.key == "scan_watermark")).scalar() or 0)
+    high = conn.execute(select(func.max(ScanEvent.id))).scalar() or 0
+    if high <= mark: return 0
+    updated = conn.execute(text(
+        "UPDATE assets SET last_scanned = latest.ts "
+        "FROM (SELECT asset_id, max(scanned_at) AS ts FROM scan_events "
+        "      WHERE id > :mark AND id <= :high AND asset_id IS NOT NULL GROUP BY asset_id) AS latest "
+        "WHERE assets.id = latest.asset_id "
+        "AND (assets.last_scanned IS NULL OR assets.last_scanned < latest.ts)"
+    ), {"mark": mark, "high": high}).rowcount
+    conn.exec_driver_sql(
+        "INSERT INTO app_meta(key, value) VALUES ('scan_watermark', ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(high),))
+    return updated
+
+def prune_scans_job(session):
+    # Rolls whole days of scan events older than SCAN_RETENTION_DAYS into scan_daily and deletes
+    # them. Waits while compaction still has events from those days to apply, and always keeps
+    # the newest event so ids (and the watermark) never restart.
+    conn = session.connection()
+    cutoff = (datetime.now() - timedelta(days=config.SCAN_RETENTION_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+    mark = int(conn.execute(select(AppMeta.value).where(AppMeta.key == "scan_watermark")).scalar() or 0)
+    high = conn.execute(select(func.max(ScanEvent.id))).scalar() or 0
+    old = conn.execute(select(func.max(ScanEvent.id)).where(ScanEvent.scanned_at < cutoff)).scalar()
+    if old is None or old > mark: return 0
+    params = {"cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S"), "high": high}
+    conn.execute(text(
+        "INSERT INTO scan_daily(day, building, room, scans, assets) "
+        "SELECT date(e.scanned_at), coalesce(a.building, ''), coalesce(a.room, ''), count(*), count(DISTINCT e.asset_id) "
+        "FROM scan_events e JOIN assets a ON a.id = e.asset_id WHERE e.scanned_at < :cutoff AND e.id < :high "
+        "GROUP BY 1, 2, 3 "
+        "ON CONFLICT(day, building, room) DO UPDATE SET scans = scans + excluded.scans, assets = assets + excluded.assets"
+    ), params)
+    return conn.execute(text("DELETE FROM scan_events WHERE scanned_at < :cutoff AND id < :high"), params).rowcount
+
+class TaskSkipped(Exception):
+    # Raised by a maintenance job that has nothing it can do; recorded as "Skipped", not "OK"
+    pass
+
+def incremental_vacuum_job(session):
+    conn = session.connection()
+    if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+        raise TaskSkipped("auto_vacuum is not INCREMENTAL on this database")
+    raw = conn.connection.driver_connection
+    # Batched behind other writes: fail the batch so the writer replays each job on its own
+    if raw.in_transaction: raise RuntimeError("incremental_vacuum cannot share a write batch")
+    before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    # One page is freed per step of a zero-column result, which execute() and SQLAlchemy stop after;
+    # executescript() steps it to completion (no transaction is open, so its implicit COMMIT is a no-op)
+    raw.executescript(f"PRAGMA incremental_vacuum({int(config.MAINT_VACUUM_PAGES)});")
+    freed = before - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    if before and not freed: raise RuntimeError(f"freelist still {before} pages after incremental_vacuum")
+    return f"{freed} of {before} free pages released"
+
+# name -> (config interval setting, job(session), changes asset data: flag or predicate on the result)
+MAINTENANCE_TASKS = {
+    "compact_scans": ("MAINT_SCAN_COMPACT_INTERVAL", compact_scans_job, bool),
+    "prune_scans": ("MAINT_SCAN_PRUNE_INTERVAL", prune_scans_job, False),
+    "optimize": ("MAINT_OPTIMIZE_INTERVAL", pragma_job(lambda: "PRAGMA optimize"), False),
+    "analyze": ("MAINT_ANALYZE_INTERVAL", pragma_job(lambda: "ANALYZE"), False),
+    "incremental_vacuum": ("MAINT_VACUUM_INTERVAL", incremental_vacuum_job, False),
+}
+
+class MaintenanceScheduler:
+    # Background thread that runs the MAINTENANCE_TASKS through the writer on their
+    # config.MAINT_*_INTERVAL schedule (seconds, 0 disables) and records timings.
+    def __init__(self, writer):
+        self.writer = writer
+        self.started = time.monotonic()
+        self.last_started = {}
+        self.history = {}
+        self.thread = threading.Thread(target=self.run, name="db-maintenance", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(config.MAINT_TICK_SECONDS)
+            for name, (interval_key, _, _) in MAINTENANCE_TASKS.items():
+                interval = getattr(config, interval_key)
+                if interval and time.monotonic() - self.last_started.get(name, self.started) >= interval:
+                    self.run_task(name)
+
+    def run_task(self, name):
+        _, job, changes_data = MAINTENANCE_TASKS[name]
+        self.last_started[name] = time.monotonic()
+        start = time.perf_counter()
+        try:
+            result = self.writer.submit(job, changes_data)
+            status = "OK" if result is None else f"OK ({result})"
+        except TaskSkipped as e:
+            status = f"Skipped: {e}"
+        except Exception as e:
+            status = f"Failed: {e}"
+        self.history[name] = {"Task": name, "Last Run": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                              "Seconds": round(time.perf_counter() - start, 4), "Status": status}
+        return self.history[name]
+
+# --- ATTACHMENT STORE ---
+def blob_path(digest):
+    # attachments/ab/cd/abcd... - two shard levels keep every directory small
+    return os.path.join(config.ATTACHMENTS_DIR, digest[:2], digest[2:4], digest)
+
+def store_blob(data):
+    # Writes the bytes once per distinct content and returns their sha256
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so a half-written upload never appears under the final name
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f: f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+# --- THUMBNAILS ---
+PREVIEW_MIMES = ("image/", "application/pdf")
+
+def render_pdf_page(path):
+    # First page as a PIL image, if an optional PDF renderer is installed
+    try:
+        import pypdfium2
+        page = pypdfium2.PdfDocument(path)[0]
+        return page.render(scale=config.THUMBNAIL_SIZE / max(page.get_size())).to_pil()
+    except ImportError:
+        pass
+    try:
+        import fitz
+        from PIL import Image
+        page = fitz.open(path)[0]
+        zoom = config.THUMBNAIL_SIZE / max(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    except ImportError:
+        return None
+
+def render_thumbnail(digest, mime):
+    # -> (status, width, height, JPEG bytes)
+    from PIL import Image
+    path = blob_path(digest)
+    if mime == "application/pdf":
+        image = render_pdf_page(path)
+        if image is None: return "unsupported", None, None, None
+    else:
+        image = Image.open(path)
+        image.draft("RGB", (config.THUMBNAIL_SIZE, config.THUMBNAIL_SIZE))  # JPEG: decode at reduced scale
+    image = image.convert("RGB")
+    image.thumbnail((config.THUMBNAIL_SIZE, config.THUMBNAIL_SIZE))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=80)
+    return "ok", image.width, image.height, out.getvalue()
+
+class ThumbnailWorker:
+    # Background thread that renders previews for new uploads; each file content is rendered once
+    def __init__(self, writer):
+        self.writer = writer
+        self.jobs = queue.Queue()
+        self.queued = set()
+        self.stats = {"rendered": 0, "unsupported": 0, "errors": 0}
+        self.thread = threading.Thread(target=self.run, name="thumbnails", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, digest, mime):
+        if not mime or not mime.startswith(PREVIEW_MIMES) or digest in self.queued: return
+        self.queued.add(digest)
+        self.jobs.put((digest, mime))
+
+    def run(self):
+        while True:
+            digest, mime = self.jobs.get()
+            try:
+                status, width, height, data = render_thumbnail(digest, mime)
+            except Exception as e:
+                print(f"Thumbnail failed for {digest[:12]}: {e}")
+                status, width, height, data = "error", None, None, None
+            self.stats[{"ok": "rendered", "unsupported": "unsupported"}.get(status, "errors")] += 1
+            row = {"sha256": digest, "status": status, "width": width, "height": height, "data": data, "created": datetime.now()}
+            try:
+                self.writer.submit(lambda session: session.merge(AttachmentThumb(**row)), changes_data=False)
+            finally:
+                self.queued.discard(digest)
+
+# One writer and one scheduler per database file, however many Database objects exist
+_shared_lock = threading.RLock()
+_shared = {}
+
+def shared_resource(key, factory):
+    with _shared_lock:
+        if key not in _shared: _shared[key] = factory()
+        return _shared[key]
+
+# --- SCHEMA MIGRATIONS ---
+# (version, description, Database method). Applied in order at startup; PRAGMA user_version
+# records the last one that ran. Steps must be idempotent: databases created before the runner
+# existed start at version 0 and replay everything.
+MIGRATIONS = [
+    (1, "Base schema, search index and indexes", "create_schema"),
+    (2, "Normalize tags into tags/asset_tags", "migrate_tags"),
+    (3, "Build per-type summary table", "rebuild_stats"),
+    (4, "Typed asset timestamps", "migrate_timestamps"),
+    (5, "Assignee index", "create_schema"),
+    (6, "Content-addressed attachment store", "migrate_attachments"),
+    (7, "Attachment thumbnail table", "create_schema"),
+    (8, "Depreciation index", "create_schema"),
+    (9, "Scan time index and daily scan rollup", "create_schema"),
+    (10, "Apply auto_vacuum to existing database files", "enable_auto_vacuum"),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_database():
+    # Process-wide Database: reruns and sessions share one engine, pool and bootstrap
+    return shared_resource(("database", config.DB_NAME), Database)
+
 # --- CONTROLLER ---
 class Database:
     def __init__(self):
         self.engine = create_engine(f'sqlite:///{config.DB_NAME}', connect_args={'check_same_thread': False})
-        Base.metadata.create_all(self.engine)
+        event.listen(self.engine, "connect", apply_pragmas)
+        self.writer = shared_resource(("writer", config.DB_NAME), lambda: WriteQueue(self.engine, config.DB_WRITE_BATCH_MAX, threaded=config.DB_WRITE_QUEUE))
+        self.maintenance = shared_resource(("maintenance", config.DB_NAME), lambda: MaintenanceScheduler(self.writer))
+        self.cache = shared_resource(("cache", config.DB_NAME), lambda: QueryCache(config.CACHE_MAX_ENTRIES, config.CACHE_MAX_MB * 1024 * 1024))
         self.Session = scoped_session(sessionmaker(bind=self.engine))
+        self.thumbnails = shared_resource(("thumbnails", config.DB_NAME), lambda: ThumbnailWorker(self.writer))
+        self.migrations = self.migrate()
+        self.search_index = inspect(self.engine).has_table('assets_fts')
         self.create_default_admin()
+        self.queue_missing_thumbnails()
+
+    def get_schema_version(self):
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+    def migrate(self):
+        # Runs pending MIGRATIONS; returns the descriptions of the steps applied
+        applied = []
+        version = self.get_schema_version()
+        for step, description, method in MIGRATIONS:
+            if step <= version: continue
+            getattr(self, method)()
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(f"PRAGMA user_version = {int(step)}")
+            print(f"Schema migration {step}: {description}")
+            applied.append(description)
+        return applied
+
+    def enable_auto_vacuum(self):
+        # PRAGMA auto_vacuum only takes effect on a new file or through a full VACUUM, so files
+        # created before DB_AUTO_VACUUM was set get that VACUUM once, here
+        wanted = {"NONE": 0, "FULL": 1, "INCREMENTAL": 2}[config.DB_AUTO_VACUUM.upper()]
+        with self.engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == wanted: return
+        print(f"Rebuilding database file for auto_vacuum = {config.DB_AUTO_VACUUM} (one-time VACUUM)...")
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql(f"PRAGMA auto_vacuum = {config.DB_AUTO_VACUUM}")
+            conn.exec_driver_sql("VACUUM")
+
+    def create_schema(self):
+        Base.metadata.create_all(self.engine)
+        self.init_search_index()
+        self.apply_ddl(STATS_DDL + PAGINATION_DDL + AUDIT_DDL + TIMESTAMP_DDL + ANALYTICS_DDL + CUSTODY_DDL + DEPRECIATION_DDL + SCAN_DDL)
+
+    def init_search_index(self):
+        # Returns False on SQLite builds without FTS5; search then falls back to LIKE scans
+        try:
+            with self.engine.begin() as conn:
+                existed = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'assets_fts'").first()
+                for stmt in SEARCH_INDEX_DDL:
+                    conn.exec_driver_sql(stmt)
+                if not existed:
+                    # Index rows that were added before the search index existed
+                    conn.exec_driver_sql("INSERT INTO assets_fts(assets_fts) VALUES ('rebuild')")
+            return True
+        except OperationalError as e:
+            print(f"Search index unavailable: {e}")
+            return False
+
+    def apply_ddl(self, statements):
+        with self.engine.begin() as conn:
+            for stmt in statements:
+                conn.exec_driver_sql(stmt)
+
+    def write(self, job, changes_data=True):
+        # Runs job(session) on the writer thread and returns its result; the job must not commit.
+        # changes_data=False (or a predicate returning False) keeps cached reads valid.
+        return self.writer.submit(job, changes_data)
+
+    def memoize(self, key, loader):
+        # View-level results (DataFrames, figure JSON) share the query cache and its invalidation
+        return self.cache.get_or_load(("view",) + freeze(key), loader)
+
+    def run_maintenance(self, name):
+        return self.maintenance.run_task(name)
+
+    def get_engine_profile(self):
+        with self.engine.connect() as conn:
+            return {p: conn.exec_driver_sql(f"PRAGMA {p}").scalar()
+                    for p in ["journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "temp_store", "auto_vacuum", "user_version"]}
+
+    def rebuild_stats(self):
+        # Recompute the per-type summary from scratch (recovery from drift)
+        def job(session):
+            conn = session.connection()
+            conn.execute(AssetTypeStats.__table__.delete())
+            conn.exec_driver_sql(
+                "INSERT INTO asset_type_stats(device_type, asset_count, total_value) "
+                f"SELECT coalesce(device_type, ''), count(*), coalesce(sum({_price_sql('assets')}), 0) "
+                "FROM assets GROUP BY coalesce(device_type, '')"
+            )
+            return conn.execute(select(func.count()).select_from(AssetTypeStats)).scalar()
+        return self.write(job)
 
     def get_session(self):
         return self.Session()
 
+    def migrate_timestamps(self):
+        # One-time conversion of the free-form date strings to the DateTime storage format.
+        # "Never"/blank become NULL; anything unparseable is logged and cleared.
+        def job(session):
+            conn = session.connection()
+            table = Asset.__table__
+            for col in TIMESTAMP_COLUMNS:
+                conn.exec_driver_sql(f"UPDATE assets SET {col} = NULL WHERE trim({col}) IN ('', 'Never')")
+                conn.exec_driver_sql(f"UPDATE assets SET {col} = {col} || '.000000' WHERE {col} GLOB '{DATETIME_GLOB}'")
+                conn.exec_driver_sql(f"UPDATE assets SET {col} = {col} || ' 00:00:00.000000' WHERE {col} GLOB '{DATE_GLOB}'")
+                odd = conn.exec_driver_sql(f"SELECT id, {col} FROM assets WHERE {col} IS NOT NULL AND {col} NOT GLOB '{STORED_GLOB}'").all()
+                fixed = []
+                for asset_id, raw in odd:
+                    try: fixed.append({"b_id": asset_id, "value": parse_timestamp(raw)})
+                    except ValueError:
+                        print(f"Asset {asset_id}: cleared unreadable {col} {raw!r}")
+                        fixed.append({"b_id": asset_id, "value": None})
+                if fixed:
+                    conn.execute(table.update().where(table.c.id == bindparam("b_id")).values({col: bindparam("value")}), fixed)
+        self.write(job)
+
+    def migrate_tags(self):
+        # One-time copy of the comma-joined Asset.tags strings into tags/asset_tags
+        return self.write(self._migrate_tags)
+
+    def _migrate_tags(self, session):
+        conn = session.connection()
+        rows = conn.execute(select(Asset.id, Asset.tags).where(Asset.tags != None, Asset.tags != "")).all()
+        links = [(asset_id, name) for asset_id, tag_str in rows for name in parse_tags(tag_str)]
+        conn.execute(asset_tags.delete())
+        if not links: return 0
+        names = sorted({name for _, name in links})
+        known = dict(conn.execute(select(Tag.name, Tag.id)).all())
+        new_names = [{"name": n} for n in names if n not in known]
+        if new_names: conn.execute(Tag.__table__.insert(), new_names)
+        tag_ids = dict(conn.execute(select(Tag.name, Tag.id)).all())
+        conn.execute(asset_tags.insert(), [{"asset_id": a, "tag_id": tag_ids[n]} for a, n in links])
+        return len(links)
+
+    def set_asset_tags(self, session, asset, tag_value):
+        names = parse_tags(tag_value)
+        tags = session.query(Tag).filter(Tag.name.in_(names)).all() if names else []
+        by_name = {t.name: t for t in tags}
+        for name in names:
+            if name not in by_name:
+                by_name[name] = Tag(name=name)
+                session.add(by_name[name])
+        asset.tag_links = [by_name[n] for n in names]
+        asset.tags = ",".join(names)
+
+    def get_tags(self, session=None):
+        # Only tags still attached to at least one asset
+        own_session = session is None
+        if own_session: session = self.get_session()
+        in_use = select(asset_tags.c.tag_id).where(asset_tags.c.tag_id == Tag.id).exists()
+        names = [r[0] for r in session.query(Tag.name).filter(in_use).order_by(Tag.name).all()]
+        if own_session: session.close()
+        return names
+
     def create_default_admin(self):
         session = self.get_session()
-        if session.query(User).count() == 0:
-            pw_bytes = "admin123".encode('utf-8')
-            salt = bcrypt.gensalt()
-            hashed = bcrypt.hashpw(pw_bytes, salt).decode('utf-8')
-            
-            admin = User(username="admin", password_hash=hashed, role="Admin", scope=config.SCOPE_ADMIN)
-            session.add(admin)
-            session.commit()
+        has_users = session.query(User).count() > 0
         session.close()
+        if has_users: return
+
+        pw_bytes = "admin123".encode('utf-8')
+        salt = bcrypt.gensalt()
+        hashed = bcrypt.hashpw(pw_bytes, salt).decode('utf-8')
+
+        def job(session):
+            if session.query(User).count() == 0:
+                session.add(User(username="admin", password_hash=hashed, role="Admin", scope=config.SCOPE_ADMIN))
+        self.write(job)
 
     # --- USER AUTH ---
     def verify_user(self, username, password):
@@ -108,19 +1028,20 @@ class Database:
 
     def add_user(self, username, password, role="User", scope="Read Only"):
         session = self.get_session()
-        if session.query(User).filter_by(username=username).first():
-            session.close()
-            return False
+        exists = session.query(User).filter_by(username=username).first() is not None
+        session.close()
+        if exists: return False
         
         salt = bcrypt.gensalt()
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
         
-        new_user = User(username=username, password_hash=hashed, role=role, scope=scope)
-        session.add(new_user)
-        session.commit()
-        session.close()
-        return True
+        def job(session):
+            if session.query(User).filter_by(username=username).first(): return False
+            session.add(User(username=username, password_hash=hashed, role=role, scope=scope))
+            return True
+        return self.write(job)
 
+    @cached_query
     def get_all_users(self):
         session = self.get_session()
         users = session.query(User).all()
@@ -129,60 +1050,64 @@ class Database:
         return result
         
     def delete_user(self, user_id):
-        session = self.get_session()
-        user = session.query(User).filter_by(id=user_id).first()
-        if user:
-            session.delete(user)
-            session.commit()
-        session.close()
+        def job(session):
+            user = session.query(User).filter_by(id=user_id).first()
+            if user: session.delete(user)
+        self.write(job)
 
     def update_user_scope(self, user_id, new_scope):
-        session = self.get_session()
-        user = session.query(User).filter_by(id=user_id).first()
-        if user:
-            user.scope = new_scope
-            session.commit()
-        session.close()
+        def job(session):
+            user = session.query(User).filter_by(id=user_id).first()
+            if user: user.scope = new_scope
+        self.write(job)
 
     def update_user_password(self, user_id, new_password):
-        session = self.get_session()
-        user = session.query(User).filter_by(id=user_id).first()
-        if user:
-            salt = bcrypt.gensalt()
-            user.password_hash = bcrypt.hashpw(new_password.encode(), salt).decode('utf-8')
-            session.commit()
-        session.close()
+        # Hash outside the writer so bcrypt doesn't hold up other writes
+        salt = bcrypt.gensalt()
+        hashed = bcrypt.hashpw(new_password.encode(), salt).decode('utf-8')
+        def job(session):
+            user = session.query(User).filter_by(id=user_id).first()
+            if user: user.password_hash = hashed
+        self.write(job)
 
     # --- ASSETS ---
     def add_asset(self, data):
-        session = self.get_session()
-        try:
+        def job(session):
             asset = Asset(
                 device_type=data[0], make=data[1], model=data[2], serial_number=data[3],
                 stock_number=data[4], itec_account=data[5], aqs_price=data[6],
                 building=data[7], room=data[8], classification=data[9],
                 rack=data[10], row=data[11], table_num=data[12], assigned_to=data[13],
-                tags=data[14], date_added=data[15], last_modified=data[16], last_scanned=data[17]
+                date_added=parse_timestamp(data[15]), last_modified=parse_timestamp(data[16]), last_scanned=parse_timestamp(data[17])
             )
+            self.set_asset_tags(session, asset, data[14])
             session.add(asset)
-            session.commit()
+            session.flush()
             return asset.id
+        try:
+            return self.write(job)
         except Exception as e:
             print(e)
-            session.rollback()
             return None
-        finally:
-            session.close()
-
-    def get_all_assets(self, tag_filter=None, search_query=None, limit=None, offset=0):
-        session = self.get_session()
-        query = session.query(Asset)
 
-        if tag_filter and tag_filter != "All":
-            query = query.filter(Asset.tags.like(f"%{tag_filter}%"))
+    def filter_assets(self, query, tag_filter=None, search_query=None, tag_mode="any"):
+        # Applies the dashboard tag/search filters; returns the FTS ranking subquery when search uses the index
+        tags = tag_names(tag_filter)
+        if tags:
+            query = query.filter(tag_filter_clause(tags, tag_mode))
 
+        ranked, match = None, None
         if search_query:
             terms = search_query.split()
+            if self.search_index:
+                match = build_match_query(search_query)
+                if match:
+                    ranked = text(
+                        f"SELECT rowid AS asset_id, bm25(assets_fts, {SEARCH_WEIGHTS}) AS score "
+                        "FROM assets_fts WHERE assets_fts MATCH :match"
+                    ).bindparams(match=match).columns(asset_id=Integer, score=Float).subquery("ranked")
+                    query = query.join(ranked, ranked.c.asset_id == Asset.id)
+                terms = unindexed_terms(search_query)
             for term in terms:
                 term_filter = f"%{term}%"
                 query = query.filter(or_(
@@ -192,9 +1117,25 @@ class Database:
                     Asset.device_type.ilike(term_filter),
                     Asset.assigned_to.ilike(term_filter)
                 ))
+        return query, ranked, match
 
-        total_count = query.count()
-        query = query.order_by(Asset.id.desc())
+    @cached_query
+    def get_all_assets(self, tag_filter=None, search_query=None, limit=None, offset=0, tag_mode="any"):
+        session = self.get_session()
+        query, ranked, match = self.filter_assets(session.query(Asset), tag_filter, search_query, tag_mode)
+
+        if ranked is not None and not tag_names(tag_filter) and not unindexed_terms(search_query):
+            # Search-only: the count comes straight from the FTS index
+            total_count = session.execute(
+                text("SELECT count(*) FROM assets_fts WHERE assets_fts MATCH :match"), {"match": match}
+            ).scalar()
+        else:
+            total_count = query.count()
+
+        if ranked is not None:
+            query = query.order_by(ranked.c.score, Asset.id.desc())
+        else:
+            query = query.order_by(Asset.id.desc())
         
         if limit:
             query = query.limit(limit).offset(offset)
@@ -204,6 +1145,241 @@ class Database:
         session.close()
         return results, total_count
 
+    @cached_query
+    def get_assignees(self):
+        session = self.get_session()
+        names = [r[0] for r in session.query(Asset.assigned_to).filter(Asset.assigned_to != None, Asset.assigned_to != "", Asset.assigned_to != "Available")
+                 .distinct().order_by(Asset.assigned_to).all()]
+        session.close()
+        return names
+
+    def get_assets_for_assignees(self, names):
+        session = self.get_session()
+        assets = session.query(Asset).filter(Asset.assigned_to.in_(names)).order_by(Asset.assigned_to, Asset.id).all()
+        results = [a.to_dict() for a in assets]
+        session.close()
+        return results
+
+    @cached_query
+    def get_depreciation_inputs(self):
+        # Columnar read for depreciation.py: price and julianday(date_added) as float arrays,
+        # device type and building as integer codes into the accompanying name lists.
+        # One row per (type, building) comes back in ix_assets_depreciation order, each holding
+        # its assets' prices (integer cents) and dates (Unix seconds) as group_concat strings
+        # that NumPy parses in C, so no Python object is built per asset.
+        with self.engine.connect() as conn:
+            groups = conn.exec_driver_sql(
+                f"SELECT coalesce(device_type, ''), coalesce(building, ''), count(*), "
+                f"group_concat(CAST(round({_price_sql('assets')} * 100) AS INTEGER)), "
+                f"group_concat(coalesce(CAST(round((julianday(date_added) - {UNIX_EPOCH_JD}) * 86400) AS INTEGER), 'nan')) "
+                "FROM assets GROUP BY device_type, building"
+            ).fetchall()
+        counts = np.array([g[2] for g in groups], dtype=np.int64)
+        type_code, types = pd.factorize(pd.Index([g[0] for g in groups], dtype=object))
+        building_code, buildings = pd.factorize(pd.Index([g[1] for g in groups], dtype=object))
+        return {
+            "price": np.fromstring(",".join(g[3] for g in groups), sep=",") / 100 if groups else np.empty(0),
+            "added": np.fromstring(",".join(g[4] for g in groups), sep=",") / 86400 + UNIX_EPOCH_JD if groups else np.empty(0),
+            "type_code": np.repeat(type_code.astype(np.int64), counts),
+            "building_code": np.repeat(building_code.astype(np.int64), counts),
+            "types": list(types), "buildings": list(buildings),
+        }
+
+    # --- ATTACHMENTS ---
+    def migrate_attachments(self):
+        # Moves the old flat "<asset id>_<file name>" files into the sharded store
+        self.create_schema()
+        if not os.path.isdir(config.ATTACHMENTS_DIR): return 0
+        moved = 0
+        for entry in os.scandir(config.ATTACHMENTS_DIR):
+            asset_id, sep, name = entry.name.partition("_")
+            if not entry.is_file() or not sep or not asset_id.isdigit() or not name: continue
+            with open(entry.path, "rb") as f: data = f.read()
+            created = datetime.fromtimestamp(entry.stat().st_mtime)
+            self.save_attachment(int(asset_id), name, data, None, None, created=created)
+            os.remove(entry.path)
+            moved += 1
+        return moved
+
+    def save_attachment(self, asset_id, name, data, mime=None, user=None, created=None):
+        # Same name on the same asset replaces the earlier upload
+        digest = store_blob(data)
+        row = {"asset_id": asset_id, "name": name, "size": len(data), "sha256": digest,
+               "mime": mime or mimetypes.guess_type(name)[0] or "application/octet-stream",
+               "created": created or datetime.now(), "user_name": user}
+        def job(session):
+            # A concurrent release may have removed an identical blob since store_blob saw it
+            if not os.path.exists(blob_path(digest)): store_blob(data)
+            conn = session.connection()
+            old = conn.execute(select(Attachment.sha256).where(Attachment.asset_id == asset_id, Attachment.name == name)).scalar()
+            conn.execute(Attachment.__table__.delete().where(Attachment.asset_id == asset_id, Attachment.name == name))
+            conn.execute(Attachment.__table__.insert(), row)
+            return old
+        old = self.write(job)
+        if old and old != digest: self.release_blob(old)
+        self.thumbnails.enqueue(digest, row["mime"])
+        return digest
+
+    def get_attachments(self, asset_id):
+        session = self.get_session()
+        rows = session.query(Attachment).filter(Attachment.asset_id == asset_id).order_by(Attachment.name).all()
+        result = [{"ID": a.id, "Name": a.name, "Size": a.size, "Hash": a.sha256, "Mime": a.mime, "Created": a.created, "User": a.user_name} for a in rows]
+        session.close()
+        return result
+
+    def read_attachment(self, digest):
+        # Only called once a download is requested; st.download_button needs the whole payload
+        with open(blob_path(digest), "rb") as f: return f.read()
+
+    def get_thumbnails(self, digests):
+        # {sha256: (status, JPEG bytes or None)} for the previews rendered so far
+        if not digests: return {}
+        session = self.get_session()
+        rows = session.query(AttachmentThumb.sha256, AttachmentThumb.status, AttachmentThumb.data).filter(AttachmentThumb.sha256.in_(list(digests))).all()
+        session.close()
+        return {r.sha256: (r.status, r.data) for r in rows}
+
+    def queue_missing_thumbnails(self):
+        # Previewable attachments without a thumbnail row (e.g. from before the worker existed)
+        session = self.get_session()
+        rendered = select(AttachmentThumb.sha256).where(AttachmentThumb.sha256 == Attachment.sha256).exists()
+        rows = session.query(Attachment.sha256, func.max(Attachment.mime)).filter(~rendered)\
+            .filter(or_(Attachment.mime.like("image/%"), Attachment.mime == "application/pdf")).group_by(Attachment.sha256).all()
+        session.close()
+        for digest, mime in rows: self.thumbnails.enqueue(digest, mime)
+        return len(rows)
+
+    def delete_attachment(self, attachment_id):
+        def job(session):
+            att = session.get(Attachment, attachment_id)
+            if not att: return None
+            session.delete(att)
+            return att.sha256
+        digest = self.write(job)
+        if digest: self.release_blob(digest)
+        return digest is not None
+
+    def release_blob(self, digest):
+        # Removes a stored file once no attachment row points at it (on the writer, so it
+        # can't interleave with a save of the same content)
+        def job(session):
+            in_use = session.query(Attachment.id).filter(Attachment.sha256 == digest).first()
+            if in_use: return
+            session.query(AttachmentThumb).filter(AttachmentThumb.sha256 == digest).delete()
+            if os.path.exists(blob_path(digest)): os.remove(blob_path(digest))
+        self.write(job, changes_data=False)
+
+    def get_attachment_stats(self):
+        session = self.get_session()
+        files, total = session.query(func.count(Attachment.id), func.coalesce(func.sum(Attachment.size), 0)).one()
+        per_blob = select(Attachment.sha256, func.max(Attachment.size).label("size")).group_by(Attachment.sha256).subquery()
+        blobs, stored = session.query(func.count(), func.coalesce(func.sum(per_blob.c.size), 0)).one()
+        session.close()
+        return {"files": files, "bytes": total, "blobs": blobs, "stored_bytes": stored}
+
+    def iter_export_chunks(self, tag_filter=None, search_query=None, tag_mode="any", chunk_size=None):
+        # Streams the filtered assets as lists of row tuples (EXPORT_COLUMNS order). Rows come off
+        # the SQLite cursor chunk_size at a time, so memory stays flat however many match.
+        chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+        session = self.get_session()
+        try:
+            query, _, _ = self.filter_assets(session.query(*[col for _, col in EXPORT_COLUMNS]), tag_filter, search_query, tag_mode)
+            result = session.execute(query.order_by(Asset.id).statement.execution_options(stream_results=True, yield_per=chunk_size))
+            for chunk in result.partitions(chunk_size):
+                yield [tuple(r) for r in chunk]
+        finally:
+            session.close()
+
+    def get_label_rows(self, tag_filter=None, search_query=None, tag_mode="any"):
+        # Just the columns a sticker needs, for every asset matching the dashboard filters
+        session = self.get_session()
+        query, _, _ = self.filter_assets(session.query(Asset.id, Asset.serial_number, Asset.make, Asset.model), tag_filter, search_query, tag_mode)
+        rows = [{"ID": r[0], "Serial": r[1], "Make": r[2], "Model": r[3]} for r in query.order_by(Asset.id).all()]
+        session.close()
+        return rows
+
+    @cached_query
+    def get_assets_page(self, tag_filter=None, search_query=None, sort_by="ID", descending=True, after=None, limit=50, tag_mode="any"):
+        # Keyset pagination: `after` is the (sort value, id) cursor of the last row seen.
+        # Returns (rows, next_cursor); next_cursor is None on the last page.
+        sort_col = SORT_KEYS[sort_by]
+        session = self.get_session()
+        query, _, _ = self.filter_assets(session.query(Asset, sort_col), tag_filter, search_query, tag_mode)
+
+        if after is not None:
+            seek = tuple_(sort_col, Asset.id)
+            # The redundant single-column bound lets SQLite seek expression indexes too
+            if descending:
+                query = query.filter(sort_col <= after[0], seek < tuple_(*after))
+            else:
+                query = query.filter(sort_col >= after[0], seek > tuple_(*after))
+        if descending:
+            query = query.order_by(sort_col.desc(), Asset.id.desc())
+        else:
+            query = query.order_by(sort_col.asc(), Asset.id.asc())
+
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][1], rows[-1][0].id)
+        results = [a.to_dict() for a, _ in rows]
+        session.close()
+        return results, next_cursor
+
+    @cached_query
+    def count_assets(self, tag_filter=None, search_query=None, tag_mode="any", estimate_over=None):
+        # Returns (count, is_estimate). With estimate_over set, counting stops at that many rows
+        # and the result is flagged as a lower bound.
+        session = self.get_session()
+        query, ranked, match = self.filter_assets(session.query(Asset.id), tag_filter, search_query, tag_mode)
+        if not tag_names(tag_filter) and not search_query:
+            result = (sum(r["Count"] for r in self.get_type_stats(session)), False)
+        elif ranked is not None and not tag_names(tag_filter) and not unindexed_terms(search_query) and estimate_over is None:
+            result = (session.execute(
+                text("SELECT count(*) FROM assets_fts WHERE assets_fts MATCH :match"), {"match": match}
+            ).scalar(), False)
+        elif estimate_over:
+            capped = session.query(func.count()).select_from(query.limit(estimate_over + 1).subquery()).scalar()
+            result = (min(capped, estimate_over), capped > estimate_over)
+        else:
+            result = (query.count(), False)
+        session.close()
+        return result
+
+    def edit_window_query(self, query, building=None, device_type=None, tag_filter=None, ordered=True):
+        # Admin bulk-edit filters. Windows filter type on the (coalesce(type, ''), id) seek index so
+        # they come back in ID order without a sort; counts (ordered=False) test the plain column,
+        # which the (device_type, make) index covers.
+        if building: query = query.filter(Asset.building == building)
+        if device_type is not None:
+            query = query.filter((SORT_KEYS["Type"] if ordered else Asset.device_type) == device_type)
+        query, _, _ = self.filter_assets(query, tag_filter)
+        return query
+
+    @cached_query
+    def get_edit_window(self, building=None, device_type=None, tag_filter=None, after=None, limit=200):
+        # One window of the bulk editor in ID order: `after` is the last ID of the previous
+        # window. Returns (rows, next_cursor); next_cursor is None on the last window.
+        session = self.get_session()
+        query = self.edit_window_query(session.query(Asset), building, device_type, tag_filter)
+        if after is not None: query = query.filter(Asset.id > after)
+        rows = query.order_by(Asset.id).limit(limit + 1).all()
+        next_cursor = rows[limit - 1].id if len(rows) > limit else None
+        results = [a.to_dict() for a in rows[:limit]]
+        session.close()
+        return results, next_cursor
+
+    @cached_query
+    def count_edit_window(self, building=None, device_type=None, tag_filter=None):
+        session = self.get_session()
+        count = self.edit_window_query(session.query(Asset.id), building, device_type, tag_filter, ordered=False).count()
+        if device_type == "":
+            # Untyped also means NULL: a second seek, since SQLite scans for an OR of the two
+            count += self.edit_window_query(session.query(Asset.id), building, None, tag_filter).filter(Asset.device_type == None).count()
+        session.close()
+        return count
+
     def get_asset_by_serial(self, serial):
         session = self.get_session()
         asset = session.query(Asset).filter_by(serial_number=serial).first()
@@ -219,103 +1395,479 @@ class Database:
         return result
 
     def update_scan_time(self, serial):
+        def job(session):
+            asset = session.query(Asset).filter_by(serial_number=serial).first()
+            if asset: asset.last_scanned = datetime.now()
+        self.write(job)
+
+    def record_scans(self, serials, user, update=True, source="usb"):
+        # Resolves a batch of scanned serials with one IN query per SQL_IN_BATCH and appends every
+        # scan to scan_events in one executemany; assets.last_scanned catches up on compaction.
+        # Returns {serial: asset summary or None}.
+        unique = list(dict.fromkeys(s for s in serials if s))
+        found = {}
         session = self.get_session()
-        asset = session.query(Asset).filter_by(serial_number=serial).first()
-        if asset:
-            asset.last_scanned = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            session.commit()
+        for batch in iter_chunks(unique, SQL_IN_BATCH):
+            rows = session.query(Asset.id, Asset.serial_number, Asset.make, Asset.model).filter(Asset.serial_number.in_(batch)).all()
+            found.update({r.serial_number: {"ID": r.id, "Serial": r.serial_number, "Make": r.make, "Model": r.model} for r in rows})
         session.close()
 
-    def update_asset_dict(self, asset_id, data_dict):
-        # FIX IMPLEMENTED: Mapping UI headers to DB columns
-        UI_TO_MODEL_MAP = {
-            "Type": "device_type",
-            "Make": "make",
-            "Model": "model",
-            "Serial": "serial_number",
-            "Stock": "stock_number",
-            "ITEC": "itec_account",
-            "Price": "aqs_price",
-            "Building": "building",
-            "Room": "room",
-            "Rack": "rack",
-            "Row": "row",
-            "Table": "table_num",
-            "Assigned To": "assigned_to",
-            "Tags": "tags",
-            "Last Scanned": "last_scanned"
-        }
+        if update and unique:
+            now = datetime.now()
+            events = [{"asset_id": found[s]["ID"] if s in found else None, "serial": s, "user_name": user,
+                       "scanned_at": now, "source": source} for s in serials if s]
+            # Journal-only write: asset data changes when compaction rolls the events up
+            self.write(lambda session: session.connection().execute(ScanEvent.__table__.insert(), events), changes_data=False)
+        return {serial: found.get(serial) for serial in unique}
 
+    @cached_query
+    def get_locations(self):
+        # {building: [rooms]} for the location pickers
         session = self.get_session()
-        asset = session.query(Asset).filter_by(id=asset_id).first()
-        if asset:
-            try:
-                for ui_key, value in data_dict.items():
-                    if ui_key in UI_TO_MODEL_MAP:
-                        db_key = UI_TO_MODEL_MAP[ui_key]
-                        setattr(asset, db_key, value)
-                
-                asset.last_modified = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                session.commit()
-                return True
-            except Exception as e:
-                print(f"Update failed: {e}")
-                session.rollback()
-                return False
-            finally:
-                session.close()
-        return False
-        
-    def delete_asset(self, asset_id):
+        rows = session.query(Asset.building, Asset.room).filter(Asset.building != None, Asset.building != "")\
+            .distinct().order_by(Asset.building, Asset.room).all()
+        session.close()
+        locations = {}
+        for building, room in rows:
+            rooms = locations.setdefault(building, [])
+            if room: rooms.append(room)
+        return locations
+
+    def get_assets_at(self, building, room=None):
+        # Assets expected at a location, for "missed" items in batch scan reports
         session = self.get_session()
-        asset = session.query(Asset).filter_by(id=asset_id).first()
-        if asset:
-            session.delete(asset)
-            session.commit()
+        query = session.query(Asset.id, Asset.serial_number, Asset.make, Asset.model, Asset.building, Asset.room).filter(Asset.building == building)
+        if room is not None: query = query.filter(Asset.room == room)
+        rows = [{"ID": r[0], "Serial": r[1], "Make": r[2], "Model": r[3], "Building": r[4], "Room": r[5]} for r in query.order_by(Asset.room, Asset.id).all()]
         session.close()
+        return rows
 
-    def add_transaction(self, asset_id, user_name, action, assignee=None):
+    def compact_scans(self):
+        return self.write(compact_scans_job, changes_data=bool)
+
+    def get_scan_history(self, asset_id, limit=50):
+        session = self.get_session()
+        rows = session.query(ScanEvent.scanned_at, ScanEvent.user_name, ScanEvent.source).filter(ScanEvent.asset_id == asset_id)\
+            .order_by(ScanEvent.scanned_at.desc()).limit(limit).all()
+        session.close()
+        return [{"Scanned": r.scanned_at, "User": r.user_name, "Source": r.source} for r in rows]
+
+    def get_scan_counts(self, since, until=None):
+        # Scans per building/room per day, e.g. for audit coverage reports. Scan inserts leave
+        # the data revision alone, so the cached result is keyed on the newest event id instead.
+        session = self.get_session()
+        high = session.query(func.max(ScanEvent.id)).scalar() or 0
+        session.close()
+        return self.scan_counts(since, until, high)
+
+    @cached_query
+    def scan_counts(self, since, until, high):
+        # Recent days come from the journal, pruned days from scan_daily. Events are appended in
+        # time order, so the journal part is the rowid range from the first event at or after
+        # `since` (found on ix_scan_events_time); CROSS JOIN keeps SQLite walking that range
+        # instead of probing the journal once per asset.
+        session = self.get_session()
+        first = session.query(ScanEvent.id).filter(ScanEvent.scanned_at >= since).order_by(ScanEvent.scanned_at).limit(1).scalar()
+        rows = []
+        if first is not None:
+            rows = session.execute(text(
+                "SELECT date(e.scanned_at) AS day, a.building, a.room, count(*) AS scans, count(DISTINCT e.asset_id) AS assets "
+                "FROM scan_events e CROSS JOIN assets a ON a.id = e.asset_id "
+                "WHERE e.id >= :first AND e.id <= :high AND e.scanned_at < :until GROUP BY 1, 2, 3"
+            ), {"first": first, "high": high, "until": (until or datetime.max).strftime("%Y-%m-%d %H:%M:%S.%f")}).all()
+        rolled = session.query(ScanDaily.day, ScanDaily.building, ScanDaily.room, ScanDaily.scans, ScanDaily.assets)\
+            .filter(ScanDaily.day >= since.strftime("%Y-%m-%d"))
+        if until is not None: rolled = rolled.filter(ScanDaily.day < until.strftime("%Y-%m-%d"))
+        rows += rolled.all()
+        session.close()
+        rows.sort(key=lambda r: (r.building or "", r.room or ""))
+        rows.sort(key=lambda r: r.day, reverse=True)
+        return [{"Day": r.day, "Building": r.building, "Room": r.room, "Scans": r.scans, "Assets": r.assets} for r in rows]
+
+    # --- ASSET HEALTH ---
+    def stale_cutoff(self, days=None):
+        # Midnight-aligned: the cached health results below are keyed on it, so they roll over
+        # once a day even when no write bumps the data revision
+        days = config.STALE_AFTER_DAYS if days is None else days
+        return datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time())
+
+    def stale_clause(self, cutoff):
+        return or_(Asset.last_scanned == None, Asset.last_scanned < cutoff)
+
+    def get_stale_assets(self, days=None, limit=100):
+        return self.stale_assets(self.stale_cutoff(days), limit)
+
+    @cached_query
+    def stale_assets(self, cutoff, limit):
+        # Never-scanned first, then oldest scan first
         session = self.get_session()
+        assets = session.query(Asset).filter(self.stale_clause(cutoff))\
+            .order_by(Asset.last_scanned.asc(), Asset.id.asc()).limit(limit).all()
+        results = [a.to_dict() for a in assets]
+        session.close()
+        return results
+
+    def count_stale_assets(self, days=None):
+        return self.stale_count(self.stale_cutoff(days))
+
+    @cached_query
+    def stale_count(self, cutoff):
+        session = self.get_session()
+        count = session.query(func.count(Asset.id)).filter(self.stale_clause(cutoff)).scalar()
+        session.close()
+        return count
+
+    def get_health_by_building(self, days=None):
+        return self.health_by_building(self.stale_cutoff(days))
+
+    @cached_query
+    def health_by_building(self, cutoff):
+        # One pass over the (building, last_scanned) index
+        session = self.get_session()
+        rows = session.query(
+            Asset.building,
+            func.sum(case((Asset.last_scanned >= cutoff, 1), else_=0)).label("healthy"),
+            func.sum(case((Asset.last_scanned < cutoff, 1), else_=0)).label("stale"),
+            func.sum(case((Asset.last_scanned == None, 1), else_=0)).label("never"),
+        ).group_by(Asset.building).order_by(Asset.building).all()
+        session.close()
+        return [{"Building": r.building, "Healthy": r.healthy, "Stale": r.stale, "Never Scanned": r.never} for r in rows]
+
+    def update_asset_dict(self, asset_id, data_dict):
+        def job(session):
+            asset = session.query(Asset).filter_by(id=asset_id).first()
+            if not asset: return False
+            for ui_key, value in data_dict.items():
+                if ui_key == "Tags":
+                    self.set_asset_tags(session, asset, value)
+                elif ui_key == "Last Scanned":
+                    asset.last_scanned = parse_timestamp(plain_value(value))
+                elif ui_key in UI_TO_MODEL_MAP:
+                    db_key = UI_TO_MODEL_MAP[ui_key]
+                    setattr(asset, db_key, value)
+            
+            asset.last_modified = datetime.now()
+            return True
         try:
+            return self.write(job)
+        except Exception as e:
+            print(f"Update failed: {e}")
+            return False
+        
+    def delete_asset(self, asset_id):
+        def job(session):
+            asset = session.query(Asset).filter_by(id=asset_id).first()
+            if asset: session.delete(asset)
+        self.write(job)
+
+    def add_transaction(self, asset_id, user_name, action, assignee=None):
+        def job(session):
             trans = Transaction(asset_id=asset_id, user_name=user_name, action=action, assignee=assignee, timestamp=datetime.now())
             session.add(trans)
             asset = session.query(Asset).filter_by(id=asset_id).first()
             if asset:
                 if action == "CHECKOUT": asset.assigned_to = assignee
                 elif action == "CHECKIN": asset.assigned_to = "Available"
-                asset.last_modified = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            session.commit()
+                asset.last_modified = datetime.now()
             return True
+        try:
+            return self.write(job)
         except Exception:
-            session.rollback()
             return False
-        finally:
-            session.close()
 
+    def audit_query(self, session):
+        # Column-only select with an outer join: no ORM objects, no per-row lazy loads,
+        # and entries whose asset row is gone still show up
+        return session.query(
+            Transaction.id, Transaction.timestamp, Transaction.action, Transaction.user_name, Transaction.assignee,
+            Asset.serial_number, Asset.make, Asset.model
+        ).outerjoin(Asset, Asset.id == Transaction.asset_id)
+
+    @staticmethod
+    def audit_row(r):
+        return {
+            "Timestamp": r.timestamp, "Action": r.action, "User": r.user_name,
+            "Asset Serial": r.serial_number, "Asset Model": f"{r.make} {r.model}" if r.serial_number else "(deleted)",
+            "Assignee": r.assignee
+        }
+
+    @cached_query
     def get_all_transactions(self):
         session = self.get_session()
-        transactions = session.query(Transaction).join(Asset).order_by(Transaction.timestamp.desc()).limit(500).all()
-        logs = []
-        for t in transactions:
-            logs.append({
-                "Timestamp": t.timestamp, "Action": t.action, "User": t.user_name,
-                "Asset Serial": t.asset.serial_number, "Asset Model": f"{t.asset.make} {t.asset.model}",
-                "Assignee": t.assignee
-            })
+        rows = self.audit_query(session).order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(500).all()
+        logs = [self.audit_row(r) for r in rows]
         session.close()
         return logs
 
+    @cached_query
+    def get_transactions_page(self, user=None, action=None, asset_id=None, start=None, end=None, before=None, limit=100):
+        # Newest-first keyset page. `before` is the (timestamp, id) cursor of the last row seen.
+        # Returns (rows, next_cursor); next_cursor is None on the last page.
+        session = self.get_session()
+        query = self.audit_query(session)
+        if user: query = query.filter(Transaction.user_name == user)
+        if action: query = query.filter(Transaction.action == action)
+        if asset_id is not None: query = query.filter(Transaction.asset_id == asset_id)
+        if start is not None: query = query.filter(Transaction.timestamp >= start)
+        if end is not None: query = query.filter(Transaction.timestamp < end)
+        if before is not None:
+            ts, tid = before
+            query = query.filter(Transaction.timestamp <= ts,
+                                 tuple_(Transaction.timestamp, Transaction.id) < tuple_(literal(ts, DateTime), literal(tid, Integer)))
+        rows = query.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(limit + 1).all()
+        session.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].timestamp, rows[-1].id)
+        return [self.audit_row(r) for r in rows], next_cursor
+
+    def get_asset_history(self, asset_id, limit=50):
+        return self.get_transactions_page(asset_id=asset_id, limit=limit)[0]
+
+    @cached_query
+    def get_audit_filters(self):
+        # Distinct users/actions for the filter dropdowns (both served by their indexes)
+        session = self.get_session()
+        users = [r[0] for r in session.query(Transaction.user_name).distinct().order_by(Transaction.user_name).all()]
+        actions = [r[0] for r in session.query(Transaction.action).distinct().order_by(Transaction.action).all()]
+        session.close()
+        return users, actions
+
+    def get_type_stats(self, session=None):
+        own_session = session is None
+        if own_session: session = self.get_session()
+        rows = session.query(AssetTypeStats).order_by(AssetTypeStats.device_type).all()
+        result = [{"Type": r.device_type, "Count": r.asset_count, "Value": r.total_value} for r in rows]
+        if own_session: session.close()
+        return result
+
+    @cached_query
     def get_stats(self):
         session = self.get_session()
-        total = session.query(Asset).count()
-        val_res = session.query(Asset.aqs_price).all()
-        value = sum(r[0] for r in val_res if r[0])
-        types = session.query(Asset.device_type).distinct().count()
-        tags_res = session.query(Asset.tags).filter(Asset.tags != None).all()
-        unique_tags = set()
-        for row in tags_res:
-            if row[0]: unique_tags.update([t.strip() for t in row[0].split(',')])
-        type_res = session.query(Asset.device_type).distinct().all()
-        
+        type_stats = self.get_type_stats(session)
+        total = sum(r["Count"] for r in type_stats)
+        value = sum(r["Value"] for r in type_stats)
+        type_list = [r["Type"] for r in type_stats if r["Type"]]
+        tag_list = self.get_tags(session)
+        session.close()
+        return total, value, len(type_list), tag_list, type_list
+
+    # --- ANALYTICS ---
+    # Small aggregated result sets for the dashboard charts; the asset table is never materialized.
+    @cached_query
+    def get_type_make_counts(self):
+        session = self.get_session()
+        rows = session.query(Asset.device_type, Asset.make, func.count(Asset.id))\
+            .group_by(Asset.device_type, Asset.make).all()
+        session.close()
+        return [{"Type": t or "Unknown", "Make": m or "Unknown", "Count": n} for t, m, n in rows]
+
+    @cached_query
+    def get_custody_counts(self):
+        session = self.get_session()
+        available = or_(Asset.assigned_to == None, Asset.assigned_to == "", Asset.assigned_to == "Available")
+        status = case((available, "Available"), else_="Assigned")
+        rows = session.query(status, func.count(Asset.id)).group_by(status).all()
+        session.close()
+        return [{"Status": s, "Count": n} for s, n in rows]
+
+    @cached_query
+    def get_value_by_type(self):
+        # Served from the trigger-maintained asset_type_stats table
+        return [{"Type": r["Type"] or "Unknown", "Price": r["Value"]} for r in self.get_type_stats() if r["Count"]]
+
+    def get_additions_by_month(self, months=12):
+        # The cached query is keyed on the window start, so it moves on when the month does
+        now = datetime.now()
+        first = now.year * 12 + now.month - months  # zero-based month index of the window start
+        return self.additions_by_month(datetime(first // 12, first % 12 + 1, 1))
+
+    @cached_query
+    def additions_by_month(self, start):
+        session = self.get_session()
+        month = func.strftime("%Y-%m", Asset.date_added)
+        rows = session.query(month, func.count(Asset.id)).filter(Asset.date_added >= start)\
+            .group_by(month).order_by(month).all()
+        session.close()
+        return [{"Month": m, "Added": n} for m, n in rows]
+
+    @cached_query
+    def count_added_since(self, since):
+        session = self.get_session()
+        count = session.query(func.count(Asset.id)).filter(Asset.date_added >= since).scalar()
         session.close()
-        return total, value, types, sorted(list(unique_tags)), [r[0] for r in type_res if r[0]]
\ No newline at end of file
+        return count
+
+    # --- BULK IMPORT ---
+    def import_assets(self, file_obj, file_name, user_name, mode="insert", dry_run=False, chunk_size=None, progress=None):
+        # mode: "insert" rejects serials that already exist, "upsert" updates them in place.
+        # Each chunk is checked against the table in one IN query and written in one transaction.
+        chunk_size = chunk_size or config.IMPORT_CHUNK_SIZE
+        report = {"rows": 0, "inserted": 0, "updated": 0, "rejected": [], "seconds": 0.0, "dry_run": dry_run}
+        seen = set()
+        start = time.perf_counter()
+
+        for chunk in iter_chunks(iter_import_rows(file_obj, file_name), chunk_size):
+            report["rows"] += len(chunk)
+            valid = []
+            for row_num, raw in chunk:
+                values = {col: clean_cell(raw[key]) for key, col in IMPORT_COLUMNS.items() if key in raw}
+                serial = values.get("serial_number", "")
+                if not serial:
+                    report["rejected"].append({"Row": row_num, "Serial": "", "Reason": "Missing serial"}); continue
+                if serial in seen:
+                    report["rejected"].append({"Row": row_num, "Serial": serial, "Reason": "Duplicate serial in file"}); continue
+                seen.add(serial)
+                if values.get("aqs_price") == "":
+                    del values["aqs_price"]
+                elif "aqs_price" in values:
+                    try: values["aqs_price"] = parse_price(raw["price"])
+                    except ValueError:
+                        report["rejected"].append({"Row": row_num, "Serial": serial, "Reason": "Invalid price"}); continue
+                if "tags" in values: values["tags"] = ",".join(parse_tags(values["tags"]))
+                valid.append((row_num, values))
+
+            existing = self.get_ids_by_serial([v["serial_number"] for _, v in valid])
+            inserts, updates, written = [], [], []
+            for row_num, values in valid:
+                asset_id = existing.get(values["serial_number"])
+                if asset_id is None:
+                    inserts.append(values)
+                    written.append((row_num, values["serial_number"]))
+                elif mode == "upsert":
+                    # Only overwrite the cells the file actually filled in
+                    changes = {k: v for k, v in values.items() if v != "" and k != "serial_number"}
+                    if changes:
+                        updates.append((asset_id, changes))
+                        written.append((row_num, values["serial_number"]))
+                else:
+                    report["rejected"].append({"Row": row_num, "Serial": values["serial_number"], "Reason": "Serial already exists"})
+
+            if dry_run:
+                report["inserted"] += len(inserts); report["updated"] += len(updates)
+            else:
+                try:
+                    self.write(lambda session: self.write_import_chunk(session.connection(), inserts, updates, user_name))
+                    report["inserted"] += len(inserts); report["updated"] += len(updates)
+                except IntegrityError as e:
+                    # The whole chunk rolled back: its updates were lost along with its inserts
+                    reason = f"Chunk rolled back: {e.orig}"
+                    report["rejected"].extend({"Row": row_num, "Serial": serial, "Reason": reason} for row_num, serial in written)
+            if progress: progress(report["rows"])
+
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    def get_ids_by_serial(self, serials):
+        found = {}
+        with self.engine.connect() as conn:
+            for batch in iter_chunks(serials, SQL_IN_BATCH):
+                found.update(conn.execute(select(Asset.serial_number, Asset.id).where(Asset.serial_number.in_(batch))).all())
+        return found
+
+    def write_import_chunk(self, conn, inserts, updates, user_name):
+        now = datetime.now()
+        table = Asset.__table__
+        if inserts:
+            rows = [{**IMPORT_DEFAULTS, "tags": "", **{k: v for k, v in r.items() if v != ""},
+                     "date_added": now, "last_modified": now, "last_scanned": None} for r in inserts]
+            keys = set().union(*rows)
+            conn.execute(table.insert(), [{k: r.get(k) for k in keys} for r in rows])
+            new_ids = {}
+            for batch in iter_chunks([r["serial_number"] for r in rows], SQL_IN_BATCH):
+                new_ids.update(conn.execute(select(Asset.serial_number, Asset.id).where(Asset.serial_number.in_(batch))).all())
+            conn.execute(Transaction.__table__.insert(), [{
+                "asset_id": new_ids[r["serial_number"]], "user_name": user_name, "timestamp": datetime.now(),
+                "action": "CREATE" if r["assigned_to"] == "Available" else "CREATE_ASSIGN", "assignee": r["assigned_to"],
+            } for r in rows])
+            self.link_tags_bulk(conn, {new_ids[r["serial_number"]]: r["tags"] for r in rows if r["tags"]})
+
+        # Rows sharing the same set of filled-in columns go out as one executemany
+        by_columns = {}
+        for asset_id, values in updates:
+            by_columns.setdefault(tuple(sorted(values)), []).append((asset_id, values))
+        for cols, group in by_columns.items():
+            stmt = table.update().where(table.c.id == bindparam("b_id")).values(
+                {**{c: bindparam(c) for c in cols}, "last_modified": now})
+            conn.execute(stmt, [{"b_id": asset_id, **values} for asset_id, values in group])
+        if updates:
+            conn.execute(Transaction.__table__.insert(), [{
+                "asset_id": asset_id, "user_name": user_name, "timestamp": datetime.now(),
+                "action": "IMPORT_UPDATE", "assignee": values.get("assigned_to"),
+            } for asset_id, values in updates])
+            self.link_tags_bulk(conn, {asset_id: values["tags"] for asset_id, values in updates if "tags" in values}, replace=True)
+
+    def link_tags_bulk(self, conn, tags_by_asset, replace=False):
+        # tags_by_asset: {asset_id: "a,b"}; set-based equivalent of set_asset_tags for many assets
+        if replace:
+            for batch in iter_chunks(list(tags_by_asset), SQL_IN_BATCH):
+                conn.execute(asset_tags.delete().where(asset_tags.c.asset_id.in_(batch)))
+        links = [(a, n) for a, tag_str in tags_by_asset.items() for n in parse_tags(tag_str)]
+        if not links: return
+        names = sorted({n for _, n in links})
+        tag_ids = {}
+        for batch in iter_chunks(names, SQL_IN_BATCH):
+            tag_ids.update(conn.execute(select(Tag.name, Tag.id).where(Tag.name.in_(batch))).all())
+        missing = [{"name": n} for n in names if n not in tag_ids]
+        if missing:
+            conn.execute(Tag.__table__.insert(), missing)
+            for batch in iter_chunks([m["name"] for m in missing], SQL_IN_BATCH):
+                tag_ids.update(conn.execute(select(Tag.name, Tag.id).where(Tag.name.in_(batch))).all())
+        conn.execute(asset_tags.insert(), [{"asset_id": a, "tag_id": tag_ids[n]} for a, n in links])
+
+    # --- CHANGE SETS ---
+    def apply_asset_changes(self, changes):
+        # changes: {asset_id: {ui_column: value}} as produced by diff_asset_frames.
+        # Valid rows are written in one transaction, one executemany per distinct column set;
+        # only those rows get a new last_modified. Returns {"changed": [ids], "rejected": {id: reason}}.
+        rejected, valid = {}, {}
+        for asset_id, cells in changes.items():
+            values = {}
+            for ui_key, value in cells.items():
+                if isinstance(value, str): value = value.strip()
+                if ui_key in REQUIRED_FIELDS and not value:
+                    rejected[asset_id] = f"{ui_key} cannot be empty"; break
+                if ui_key == "Price":
+                    try: value = parse_price(value)
+                    except ValueError:
+                        rejected[asset_id] = "Invalid price"; break
+                if ui_key == "Tags": value = ",".join(parse_tags(value))
+                if ui_key == "Last Scanned":
+                    try: value = parse_timestamp(value)
+                    except ValueError:
+                        rejected[asset_id] = "Invalid Last Scanned date"; break
+                values[UI_TO_MODEL_MAP[ui_key]] = value
+            else:
+                if values: valid[asset_id] = values
+
+        new_serials = {}
+        for asset_id, values in valid.items():
+            if "serial_number" in values: new_serials.setdefault(values["serial_number"], []).append(asset_id)
+        owners = self.get_ids_by_serial(list(new_serials))
+        for serial, ids in new_serials.items():
+            for asset_id in ids:
+                if len(ids) > 1 or owners.get(serial, asset_id) != asset_id:
+                    rejected[asset_id] = f"Serial {serial} already in use"
+                    valid.pop(asset_id, None)
+
+        if valid:
+            now = datetime.now()
+            table = Asset.__table__
+            by_columns = {}
+            for asset_id, values in valid.items():
+                by_columns.setdefault(tuple(sorted(values)), []).append((asset_id, values))
+            def job(session):
+                conn = session.connection()
+                for cols, group in by_columns.items():
+                    stmt = table.update().where(table.c.id == bindparam("b_id")).values(
+                        {**{c: bindparam(c) for c in cols}, "last_modified": now})
+                    conn.execute(stmt, [{"b_id": asset_id, **values} for asset_id, values in group])
+                self.link_tags_bulk(conn, {a: v["tags"] for a, v in valid.items() if "tags" in v}, replace=True)
+            try:
+                self.write(job)
+            except IntegrityError as e:
+                rejected.update({asset_id: f"Save failed: {e.orig}" for asset_id in valid})
+                valid = {}
+        return {"changed": sorted(valid), "rejected": rejected}
@@ -0,0 +1,156 @@
+# decoder.py
+# Staged barcode/QR decode for camera frames (cheap attempts first, full resolution last)
+# and batch decoding of photo ZIPs / videos
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+from pyzbar import pyzbar
+import config
+
+STAGES = ["downscale", "threshold", "roi", "full"]
+
+def symbols(names=None):
+    # Symbology names from config -> pyzbar enum members (unknown names are ignored)
+    names = config.SCAN_SYMBOLOGIES if names is None else names
+    return [pyzbar.ZBarSymbol[n] for n in names if n in pyzbar.ZBarSymbol.__members__]
+
+def to_gray(frame):
+    # JPEG/PNG bytes or an already-decoded array -> single-channel uint8 image
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if frame.ndim == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+def downscale(gray, max_side):
+    h, w = gray.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1: return gray, 1.0
+    return cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA), scale
+
+def find_rois(gray, limit):
+    # Barcode-like regions: strong gradients closed into blobs, largest first, as (x, y, w, h)
+    grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+    _, mask = cv2.threshold(cv2.blur(grad, (9, 9)), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7)))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = sorted((cv2.boundingRect(c) for c in contours), key=lambda b: b[2] * b[3], reverse=True)
+    min_area = gray.shape[0] * gray.shape[1] * 0.005
+    return [b for b in boxes if b[2] * b[3] >= min_area][:limit]
+
+def decode_frame(frame, symbologies=None):
+    # Returns {"codes": [(data, symbology)], "stage": first stage that decoded (or None),
+    #          "timings": {stage: ms}} - stages after the first hit are skipped.
+    wanted = symbols(symbologies)
+    timings = {}
+    result = {"codes": [], "stage": None, "timings": timings}
+
+    def attempt(stage, image):
+        start = time.perf_counter()
+        found = pyzbar.decode(image, symbols=wanted or None)
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+        if found and not result["codes"]:
+            result["codes"] = list(dict.fromkeys((f.data.decode("utf-8", "replace"), f.type) for f in found))
+            result["stage"] = stage
+        return bool(found)
+
+    start = time.perf_counter()
+    gray = to_gray(frame)
+    timings["load"] = (time.perf_counter() - start) * 1000
+    if gray is None: return result
+
+    start = time.perf_counter()
+    small, scale = downscale(gray, config.DECODE_MAX_SIDE)
+    timings["prepare"] = (time.perf_counter() - start) * 1000
+    if attempt("downscale", small): return result
+
+    start = time.perf_counter()
+    binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+    timings["prepare"] += (time.perf_counter() - start) * 1000
+    if attempt("threshold", binary): return result
+
+    # Regions found on the small image, cropped from the full-resolution one
+    start = time.perf_counter()
+    rois = find_rois(small, config.DECODE_ROI_LIMIT)
+    timings["prepare"] += (time.perf_counter() - start) * 1000
+    for x, y, w, h in rois:
+        pad = 0.15
+        x0, y0 = int(max(0, (x - w * pad) / scale)), int(max(0, (y - h * pad) / scale))
+        x1, y1 = int(min(gray.shape[1], (x + w * (1 + pad)) / scale)), int(min(gray.shape[0], (y + h * (1 + pad)) / scale))
+        if attempt("roi", gray[y0:y1, x0:x1]): return result
+
+    if scale < 1: attempt("full", gray)
+    return result
+
+# --- BATCH INGESTION ---
+# Photo ZIPs and walk-through videos: frames are sampled, decoded in a process pool and
+# reduced to one deduplicated set of payloads.
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".m4v")
+
+def iter_zip_frames(file_obj):
+    # -> (member name, encoded image bytes) for every image in the archive
+    with zipfile.ZipFile(file_obj) as zf:
+        for info in zf.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield info.filename, zf.read(info)
+
+def iter_video_frames(path, every_seconds=None, max_frames=None):
+    # -> ("t=12.5s", grayscale frame) sampled every `every_seconds` of video
+    every_seconds = every_seconds or config.INGEST_VIDEO_STEP_SECONDS
+    max_frames = max_frames or config.INGEST_MAX_FRAMES
+    capture = cv2.VideoCapture(path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, int(round(fps * every_seconds)))
+        index = sampled = 0
+        while sampled < max_frames:
+            # grab() skips decoding the frames in between; only sampled ones are retrieved
+            if not capture.grab(): break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok: break
+                sampled += 1
+                yield f"t={index / fps:.1f}s", cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            index += 1
+    finally:
+        capture.release()
+
+def decode_job(item):
+    name, frame = item
+    return name, decode_frame(frame)["codes"]
+
+def decode_batch(frames, progress=None):
+    # frames: iterable of (name, bytes or array). Returns {"codes": {payload: [frame names]},
+    # "frames": n, "empty": [frame names with nothing decoded], "seconds": wall time}
+    start = time.perf_counter()
+    report = {"codes": {}, "frames": 0, "empty": [], "seconds": 0.0}
+
+    def collect(name, codes):
+        report["frames"] += 1
+        if not codes: report["empty"].append(name)
+        for payload, _ in codes: report["codes"].setdefault(payload, []).append(name)
+        if progress: progress(report["frames"])
+
+    frames = iter(frames)
+    if config.INGEST_POOL_WORKERS != 1:
+        try:
+            with ProcessPoolExecutor(max_workers=config.INGEST_POOL_WORKERS) as pool:
+                # Bounded window of in-flight frames so a long video never sits in memory at once
+                pending = deque()
+                for item in frames:
+                    pending.append(pool.submit(decode_job, item))
+                    if len(pending) >= config.INGEST_IN_FLIGHT: collect(*pending.popleft().result())
+                while pending: collect(*pending.popleft().result())
+            report["seconds"] = time.perf_counter() - start
+            return report
+        except BrokenProcessPool as e:
+            # Frames in flight are lost with the pool; decode the rest in-process
+            print(f"Decode process pool failed, continuing in-process: {e}")
+    for item in frames: collect(*decode_job(item))
+    report["seconds"] = time.perf_counter() - start
+    return report
@@ -0,0 +1,69 @@
+# depreciation.py
+# Portfolio book values, computed column-wise with NumPy over Database.get_depreciation_inputs()
+from datetime import datetime
+import numpy as np
+import config
+from database import UNIX_EPOCH_JD
+
+METHODS = {"Straight Line": "straight_line", "Declining Balance": "declining_balance"}
+
+def julian_day(when):
+    return (when - datetime(1970, 1, 1)).total_seconds() / 86400 + UNIX_EPOCH_JD
+
+def type_lives(type_names):
+    # Useful life (years) per distinct device type, indexed like the type codes
+    return np.array([config.DEPRECIATION_LIFE_YEARS.get(t, config.DEPRECIATION_DEFAULT_LIFE) for t in type_names], dtype=float)
+
+def book_values(price, age_years, life_years, method="straight_line"):
+    # Vectorised: all arguments are arrays of equal length (or scalars)
+    price = np.asarray(price, dtype=float)
+    age = np.clip(np.asarray(age_years, dtype=float), 0, None)
+    life = np.asarray(life_years, dtype=float)
+    salvage = price * config.DEPRECIATION_SALVAGE_PCT
+    if method == "straight_line":
+        value = price - (price - salvage) * np.minimum(age / life, 1.0)
+    elif method == "declining_balance":
+        rate = np.minimum(config.DECLINING_BALANCE_FACTOR / life, 1.0)
+        value = price * (1.0 - rate) ** age
+        value = np.where(age >= life, salvage, np.maximum(value, salvage))
+    else:
+        raise ValueError(f"Unknown depreciation method: {method}")
+    return value
+
+def portfolio(inputs, as_of=None, method="straight_line"):
+    # -> per-asset arrays (cost, book value, owned) for the columnar inputs; undated assets hold full cost
+    as_of = as_of or datetime.now()
+    age = (julian_day(as_of) - inputs["added"]) / 365.25
+    age = np.where(np.isnan(age), 0.0, age)
+    lives = type_lives(inputs["types"])[inputs["type_code"]]
+    # Assets added after the as-of date aren't in the portfolio yet
+    owned = ~(age < 0)
+    cost = np.where(owned, inputs["price"], 0.0)
+    return cost, book_values(cost, age, lives, method), owned
+
+def summary(inputs, as_of=None, method="straight_line"):
+    cost, value, owned = portfolio(inputs, as_of, method)
+    return {"assets": int(owned.sum()), "cost": float(cost.sum()), "book_value": float(value.sum()), "depreciation": float((cost - value).sum())}
+
+def report(inputs, as_of=None, method="straight_line", group_by="Type"):
+    # Cost / book value / depreciation per device type or building, via bincount on the group codes
+    cost, value, owned = portfolio(inputs, as_of, method)
+    codes, names = (inputs["type_code"], inputs["types"]) if group_by == "Type" else (inputs["building_code"], inputs["buildings"])
+    n = len(names)
+    counts = np.bincount(codes, weights=owned, minlength=n)
+    cost_sum = np.bincount(codes, weights=cost, minlength=n)
+    value_sum = np.bincount(codes, weights=value, minlength=n)
+    return [{group_by: names[i] or "Unknown", "Assets": int(counts[i]), "Cost": round(float(cost_sum[i]), 2),
+             "Book Value": round(float(value_sum[i]), 2), "Depreciation": round(float(cost_sum[i] - value_sum[i]), 2)}
+            for i in range(n) if counts[i]]
+
+def add_years(when, years):
+    try: return when.replace(year=when.year + years)
+    except ValueError: return when.replace(year=when.year + years, day=28)  # 29 Feb
+
+def asset_curve(price, added, device_type, method="straight_line"):
+    # Yearly book values of one asset over its useful life -> (dates, values)
+    life = config.DEPRECIATION_LIFE_YEARS.get(device_type, config.DEPRECIATION_DEFAULT_LIFE)
+    years = np.arange(int(np.ceil(life)) + 1)
+    dates = [add_years(added, int(y)) for y in years]
+    return dates, book_values(np.full(len(years), price), years, life, method)
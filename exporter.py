@@ -0,0 +1,107 @@
+# exporter.py
+# Streaming asset export: chunks from Database.iter_export_chunks are written to the output
+# file as they arrive, so memory is bounded by one chunk whatever the table size.
+import csv
+import os
+import time
+from datetime import datetime
+import config
+from database import EXPORT_COLUMNS
+
+FORMATS = {"CSV": ".csv", "Parquet": ".parquet", "Excel (XLSX)": ".xlsx"}
+MIME_TYPES = {
+    ".csv": "text/csv",
+    ".parquet": "application/vnd.apache.parquet",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+HEADERS = [name for name, _ in EXPORT_COLUMNS]
+PREFIX = "assets_"
+DATE_COLUMNS = {"Date Added", "Last Modified", "Last Scanned"}
+
+def price_or_none(value):
+    # Legacy rows can hold text in the price column; typed outputs get NULL instead
+    return float(value) if isinstance(value, (int, float)) else None
+
+# --- WRITERS ---
+# Each writer takes the chunk iterator and a path, and returns the number of rows written.
+def write_csv(chunks, path):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+def write_parquet(chunks, path):
+    # One row group per chunk, zstd-compressed columns
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {"ID": pa.int64(), "Price": pa.float64(), **{c: pa.timestamp("us") for c in DATE_COLUMNS}}
+    schema = pa.schema([(h, types.get(h, pa.string())) for h in HEADERS])
+    price_at = HEADERS.index("Price")
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression=config.EXPORT_PARQUET_COMPRESSION) as writer:
+        for chunk in chunks:
+            columns = [list(col) for col in zip(*chunk)]
+            columns[price_at] = [price_or_none(v) for v in columns[price_at]]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            rows += len(chunk)
+    return rows
+
+def write_xlsx(chunks, path):
+    # Write-only workbook: rows are flushed to the sheet XML instead of held as cells
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Assets")
+    ws.append(HEADERS)
+    rows = 0
+    for chunk in chunks:
+        for row in chunk:
+            if rows >= config.EXPORT_XLSX_MAX_ROWS:
+                raise ValueError(f"Excel sheets hold at most {config.EXPORT_XLSX_MAX_ROWS:,} rows; use CSV or Parquet")
+            ws.append(row)
+            rows += 1
+    wb.save(path)
+    return rows
+
+WRITERS = {".csv": write_csv, ".parquet": write_parquet, ".xlsx": write_xlsx}
+
+def export_assets(db, fmt, tag_filter=None, search_query=None, tag_mode="any", progress=None):
+    # Writes the filtered assets to EXPORT_DIR, rotates old exports and returns a report
+    # {"path", "rows", "seconds", "rows_per_sec", "bytes", "mime", "deleted"}.
+    ext = FORMATS[fmt]
+    os.makedirs(config.EXPORT_DIR, exist_ok=True)
+    stem = os.path.join(config.EXPORT_DIR, f"{PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    path, n = stem + ext, 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{stem}-{n}{ext}"
+    start = time.perf_counter()
+
+    def counted(chunks):
+        done = 0
+        for chunk in chunks:
+            yield chunk
+            done += len(chunk)
+            if progress: progress(done, time.perf_counter() - start)
+
+    chunks = counted(db.iter_export_chunks(tag_filter, search_query, tag_mode))
+    try:
+        rows = WRITERS[ext](chunks, path)
+    except Exception:
+        if os.path.exists(path): os.remove(path)
+        raise
+    seconds = time.perf_counter() - start
+    return {"path": path, "rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else 0.0,
+            "bytes": os.path.getsize(path), "mime": MIME_TYPES[ext], "deleted": rotate()}
+
+def rotate(keep=None):
+    # Deletes all but the newest `keep` export files -> names deleted
+    keep = config.EXPORT_KEEP if keep is None else keep
+    files = [e for e in os.scandir(config.EXPORT_DIR)
+             if e.is_file() and e.name.startswith(PREFIX) and os.path.splitext(e.name)[1] in MIME_TYPES]
+    files.sort(key=lambda e: (e.stat().st_mtime, e.name), reverse=True)
+    for e in files[keep:]: os.remove(e.path)
+    return [e.name for e in files[keep:]]
@@ -0,0 +1,182 @@
+# labels.py
+# Printable documents: QR sticker sheets and handover forms
+import io
+import re
+import zipfile
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+from fpdf import FPDF
+import config
+
+# --- QR MATRICES ---
+# Encoded QR codes are kept as runs of dark modules, so a label is a handful of filled
+# rectangles in the PDF instead of a PNG written to disk and decoded again by FPDF.
+_qr_cache = OrderedDict()
+_qr_lock = threading.Lock()
+_qr_stats = {"hits": 0, "misses": 0}
+
+def qr_runs(serial):
+    # -> (modules per side, ((row, col, length), ...)) for the dark horizontal runs
+    qr = qrcode.QRCode(border=1)
+    qr.add_data(str(serial))
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    runs = []
+    for r, line in enumerate(matrix):
+        c = 0
+        while c < len(line):
+            if not line[c]:
+                c += 1
+                continue
+            start = c
+            while c < len(line) and line[c]: c += 1
+            runs.append((r, start, c - start))
+    return len(matrix), tuple(runs)
+
+def encode_all(serials):
+    # Large batches are encoded in a process pool; small ones in-process
+    if len(serials) >= config.QR_POOL_THRESHOLD and config.QR_POOL_WORKERS != 1:
+        try:
+            with ProcessPoolExecutor(max_workers=config.QR_POOL_WORKERS) as pool:
+                return list(pool.map(qr_runs, serials, chunksize=64))
+        except Exception as e:
+            print(f"QR process pool unavailable, encoding in-process: {e}")
+    return [qr_runs(s) for s in serials]
+
+def qr_runs_many(serials):
+    # Cached qr_runs for a batch, in the order given
+    found = {}
+    with _qr_lock:
+        for s in dict.fromkeys(serials):
+            if s in _qr_cache:
+                _qr_cache.move_to_end(s)
+                found[s] = _qr_cache[s]
+        missing = [s for s in dict.fromkeys(serials) if s not in found]
+        _qr_stats["hits"] += len(found)
+        _qr_stats["misses"] += len(missing)
+
+    if missing:
+        encoded = dict(zip(missing, encode_all(missing)))
+        found.update(encoded)
+        with _qr_lock:
+            _qr_cache.update(encoded)
+            while len(_qr_cache) > config.QR_CACHE_SIZE: _qr_cache.popitem(last=False)
+    return [found[s] for s in serials]
+
+def qr_cache_info():
+    with _qr_lock:
+        return {**_qr_stats, "entries": len(_qr_cache)}
+
+def draw_qr(pdf, x, y, side, matrix):
+    size, runs = matrix
+    module = side / size
+    for r, c, n in runs:
+        pdf.rect(x + c * module, y + r * module, n * module, module, 'F')
+
+# --- STICKER SHEET ---
+def qr_sheet(rows):
+    # rows: dicts with ID, Serial, Make, Model -> PDF bytes, 3 x 7 stickers per A4 page
+    rows = list(rows)
+    matrices = qr_runs_many([str(r['Serial']) for r in rows])
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=False)
+    pdf.set_fill_color(0, 0, 0)
+
+    w, h = 60, 35
+    cols = 3
+    x_start, y_start = 10, 10
+    per_page = cols * int((280 - y_start) // h)
+
+    for i, (row, matrix) in enumerate(zip(rows, matrices)):
+        if i % per_page == 0: pdf.add_page()
+        slot = i % per_page
+        x = x_start + (slot % cols) * w
+        y = y_start + (slot // cols) * h
+
+        pdf.rect(x, y, w, h)
+        draw_qr(pdf, x + 2, y + 2, 20, matrix)
+
+        pdf.set_xy(x + 24, y + 5)
+        pdf.set_font("Arial", 'B', 9)
+        pdf.multi_cell(34, 4, txt=f"{str(row['Make'])[:15]}\n{str(row['Model'])[:15]}")
+
+        pdf.set_xy(x + 24, y + 15)
+        pdf.set_font("Arial", size=7)
+        pdf.cell(34, 4, txt=f"S/N: {row['Serial']}", ln=1)
+        pdf.set_xy(x + 24, y + 19)
+        pdf.cell(34, 4, txt=f"ID: {row['ID']}", ln=1)
+
+    return pdf.output(dest='S').encode('latin-1')
+
+# --- HANDOVER FORMS ---
+def draw_handover(pdf, asset, assignee, issued=None):
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, txt="ASSET HANDOVER FORM", ln=True, align='C')
+    pdf.ln(10)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"Date: {(issued or datetime.now().date()).strftime('%Y-%m-%d')}", ln=True)
+    pdf.ln(5)
+    
+    # Details
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="1. Device Details", ln=True)
+    pdf.set_font("Arial", size=12)
+    details = [f"Make: {asset['Make']}", f"Model: {asset['Model']}", f"Serial: {asset['Serial']}", f"ID: {asset['ID']}", f"Loc: {asset['Building']} {asset['Room']}"]
+    for line in details: pdf.cell(200, 8, txt=line, ln=True)
+    pdf.ln(5)
+    
+    # Assignment
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="2. Employee Assignment", ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt=f"Issued To: {assignee}", ln=True)
+    pdf.ln(20)
+    
+    # Signatures
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(200, 10, txt="3. Acceptance", ln=True)
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(0, 5, txt="I acknowledge receipt of the equipment listed above.")
+    pdf.ln(25)
+    pdf.cell(90, 10, txt="__________________________", ln=0)
+    pdf.cell(90, 10, txt="__________________________", ln=1)
+    pdf.cell(90, 5, txt="Employee Signature", ln=0)
+    pdf.cell(90, 5, txt="IT Admin Signature", ln=1)
+
+_handover_cache = OrderedDict()
+_handover_lock = threading.Lock()
+
+def handover_pdf(asset, assignee):
+    # Bytes are reused until the asset is edited or reassigned, or the day (the printed date) changes
+    issued = datetime.now().date()
+    key = (asset['ID'], assignee, str(asset['Last Modified']), issued)
+    with _handover_lock:
+        if key in _handover_cache:
+            _handover_cache.move_to_end(key)
+            return _handover_cache[key]
+    pdf = FPDF()
+    draw_handover(pdf, asset, assignee, issued)
+    data = pdf.output(dest='S').encode('latin-1')
+    with _handover_lock:
+        _handover_cache[key] = data
+        while len(_handover_cache) > config.HANDOVER_CACHE_SIZE: _handover_cache.popitem(last=False)
+    return data
+
+def handover_batch(assets, as_zip=False):
+    # One form per asset, issued to its current assignee: a single merged PDF, or a ZIP of the
+    # individual (cached) PDFs grouped in one folder per assignee
+    if not as_zip:
+        pdf = FPDF()
+        for asset in assets: draw_handover(pdf, asset, asset['Assigned To'])
+        return pdf.output(dest='S').encode('latin-1')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for asset in assets:
+            folder = re.sub(r'[^\w.-]+', '_', str(asset['Assigned To'])) or "Unassigned"
+            zf.writestr(f"{folder}/Handover_{asset['Serial']}.pdf", handover_pdf(asset, asset['Assigned To']))
+    return buffer.getvalue()
@@ -1,6 +1,7 @@
 # run_app.py
 import streamlit.web.cli as stcli
 import os, sys
+import multiprocessing
 
 def resolve_path(path):
     if getattr(sys, "frozen", False):
@@ -10,6 +11,9 @@ def resolve_path(path):
     return os.path.join(basedir, path)
 
 if __name__ == "__main__":
+    # 0. Let process-pool workers (QR label rendering) start inside the frozen exe
+    multiprocessing.freeze_support()
+    
     # 1. Set environment variables to prevent browser issues
     os.environ["STREAMLIT_SERVER_HEADLESS"] = "true"
     
@@ -2,142 +2,69 @@ import streamlit as st
 import pandas as pd
 import time
 import io
-import plotly.express as px
+import sys
+import importlib
 from datetime import datetime, timedelta
 import config
-import qrcode
-import cv2
-import numpy as np
-from pyzbar.pyzbar import decode
-from fpdf import FPDF
+from database import SORT_KEYS, MAINTENANCE_TASKS, diff_asset_frames, parse_price
+import depreciation
 import os
-import re
+import sqlite3
 import tempfile
-
-# --- SETUP: ATTACHMENTS FOLDER ---
-ATTACHMENTS_DIR = "attachments"
-if not os.path.exists(ATTACHMENTS_DIR):
-    os.makedirs(ATTACHMENTS_DIR)
+import backup
+
+# --- LAZY IMPORTS ---
+# OpenCV/pyzbar (via decoder), qrcode and fpdf (via labels), pyarrow/openpyxl (via exporter)
+# and Plotly load on first use instead of at startup.
+IMPORT_TIMES = {}   # module -> seconds its first import took
+STARTUP_TIMES = {}  # app startup phase -> seconds (first run only)
+VIEW_TIMES = {}     # view -> first render seconds and the modules it pulled in
+
+def load(module_name, attr=None):
+    module = sys.modules.get(module_name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        IMPORT_TIMES[module_name] = time.perf_counter() - start
+    return getattr(module, attr) if attr else module
+
+def record_startup(phase, seconds):
+    STARTUP_TIMES.setdefault(phase, seconds)
+
+def render_view(name, view, *args):
+    # Runs a page; the first render of each page is timed for the Admin report
+    if name in VIEW_TIMES: return view(*args)
+    loaded = set(IMPORT_TIMES)
+    start = time.perf_counter()
+    try:
+        return view(*args)
+    finally:
+        VIEW_TIMES[name] = {"Seconds": time.perf_counter() - start, "Imports": ", ".join(m for m in IMPORT_TIMES if m not in loaded)}
 
 # --- HELPER: STALE ASSET CHECK ---
-def get_asset_health(last_scanned_str):
-    if not last_scanned_str or last_scanned_str == "Never":
+def get_asset_health(last_scanned):
+    if last_scanned is None or pd.isna(last_scanned):
         return "🔴", "Never Scanned", True
-    try:
-        scan_date = pd.to_datetime(last_scanned_str)
-        if (datetime.now() - scan_date).days > 180:
-            return "🔴", f"Stale (>6mo)", True
-        return "🟢", "Healthy", False
-    except:
-        return "⚪", "Unknown", True
-
-# --- HELPER: PDF HANDOVER GENERATOR ---
-def generate_handover_pdf(asset, assignee):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, txt="ASSET HANDOVER FORM", ln=True, align='C')
-    pdf.ln(10)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
-    pdf.ln(5)
-    
-    # Details
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="1. Device Details", ln=True)
-    pdf.set_font("Arial", size=12)
-    details = [f"Make: {asset['Make']}", f"Model: {asset['Model']}", f"Serial: {asset['Serial']}", f"ID: {asset['ID']}", f"Loc: {asset['Building']} {asset['Room']}"]
-    for line in details: pdf.cell(200, 8, txt=line, ln=True)
-    pdf.ln(5)
-    
-    # Assignment
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="2. Employee Assignment", ln=True)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"Issued To: {assignee}", ln=True)
-    pdf.ln(20)
-    
-    # Signatures
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="3. Acceptance", ln=True)
-    pdf.set_font("Arial", size=10)
-    pdf.multi_cell(0, 5, txt="I acknowledge receipt of the equipment listed above.")
-    pdf.ln(25)
-    pdf.cell(90, 10, txt="__________________________", ln=0)
-    pdf.cell(90, 10, txt="__________________________", ln=1)
-    pdf.cell(90, 5, txt="Employee Signature", ln=0)
-    pdf.cell(90, 5, txt="IT Admin Signature", ln=1)
-    
-    return pdf.output(dest='S').encode('latin-1')
-
-# --- HELPER: BULK QR SHEET GENERATOR (WINDOWS FIX) ---
-def generate_qr_sheet(assets_df):
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", size=8)
-    
-    w, h = 60, 35
-    cols = 3
-    x_start, y_start = 10, 10
-    col_counter, row_counter = 0, 0
-    
-    for index, row in assets_df.iterrows():
-        x = x_start + (col_counter * w)
-        y = y_start + (row_counter * h)
-        
-        if y + h > 280:
-            pdf.add_page()
-            col_counter, row_counter = 0, 0
-            y, x = y_start, x_start
-
-        pdf.rect(x, y, w, h)
-        
-        # QR Generation
-        qr = qrcode.QRCode(box_size=10, border=1)
-        qr.add_data(str(row['Serial']))
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # WINDOWS FIX: Close file before passing to FPDF
-        tmp_name = ""
-        try:
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-                img.save(tmp_file.name)
-                tmp_name = tmp_file.name
-            
-            # Now file is closed, FPDF can open it
-            pdf.image(tmp_name, x=x+2, y=y+2, w=20, h=20)
-            
-        except Exception as e:
-            print(f"QR Error: {e}")
-        finally:
-            # Cleanup
-            if tmp_name and os.path.exists(tmp_name):
-                try: os.remove(tmp_name)
-                except: pass
-
-        # Text
-        pdf.set_xy(x + 24, y + 5)
-        pdf.set_font("Arial", 'B', 9)
-        pdf.multi_cell(34, 4, txt=f"{str(row['Make'])[:15]}\n{str(row['Model'])[:15]}")
-        
-        pdf.set_xy(x + 24, y + 15)
-        pdf.set_font("Arial", size=7)
-        pdf.cell(34, 4, txt=f"S/N: {row['Serial']}", ln=1)
-        pdf.set_xy(x + 24, y + 19)
-        pdf.cell(34, 4, txt=f"ID: {row['ID']}", ln=1)
-        
-        col_counter += 1
-        if col_counter >= cols:
-            col_counter = 0
-            row_counter += 1
-            
-    return pdf.output(dest='S').encode('latin-1')
+    if (datetime.now() - pd.Timestamp(last_scanned)).days > config.STALE_AFTER_DAYS:
+        return "🔴", f"Stale (>{config.STALE_AFTER_DAYS}d)", True
+    return "🟢", "Healthy", False
+
+def health_emojis(last_scanned):
+    # Vectorised get_asset_health for a whole column of timestamps
+    cutoff = pd.Timestamp.now() - pd.Timedelta(days=config.STALE_AFTER_DAYS)
+    scanned = pd.to_datetime(last_scanned)
+    return pd.Series("🟢", index=last_scanned.index).where(scanned >= cutoff, "🔴")
+
+# --- HELPER: CACHED CHARTS ---
+def cached_chart(db, key, build):
+    # Figures are cached as JSON per data revision so every session reuses the same build
+    # build(px) only runs on a cache miss, so plotly.express stays unloaded when every chart is cached
+    fig_json = db.memoize(("chart",) + key, lambda: build(load("plotly.express")).to_json())
+    st.plotly_chart(load("plotly.io").from_json(fig_json), use_container_width=True)
 
 # --- HELPER: SINGLE QR ---
 def generate_qr(data):
-    qr = qrcode.QRCode(box_size=10, border=4)
+    qr = load("qrcode").QRCode(box_size=10, border=4)
     qr.add_data(data)
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
@@ -174,29 +101,24 @@ def show_asset_dialog(asset, user_scope, db):
             if status == "Available": st.success(f"**Status:** {status}")
             else:
                 st.warning(f"**Assigned To:** {status}")
-                pdf_bytes = generate_handover_pdf(asset, status)
-                st.download_button(label="📄 Handover Form", data=pdf_bytes, file_name=f"Handover_{asset['Serial']}.pdf", mime="application/pdf")
+                if st.button("📄 Handover Form"):
+                    pdf_bytes = load("labels").handover_pdf(asset, status)
+                    st.download_button(label="⬇ Download Handover Form", data=pdf_bytes, file_name=f"Handover_{asset['Serial']}.pdf", mime="application/pdf")
             
             st.write(f"**Price:** ${asset['Price']}")
             st.write(f"**Tags:** {asset['Tags']}")
 
         st.divider()
         
-        # Financial Lifecycle (Fixed Regex)
+        # Financial Lifecycle (same engine as the portfolio book-value report)
         if asset['Date Added'] and asset['Price']:
             try:
-                # FIX: Regex cleaning for robustness
-                raw_p = str(asset['Price'])
-                clean_p = re.sub(r'[^\d.]', '', raw_p)
-                price = float(clean_p) if clean_p else 0.0
-                
-                p_date = pd.to_datetime(asset['Date Added'])
-                dates = [p_date + pd.DateOffset(years=i) for i in range(6)]
-                values = [max(0, price - (price/5 * i)) for i in range(6)]
+                price = parse_price(asset['Price'])
+                dates, values = depreciation.asset_curve(price, pd.Timestamp(asset['Date Added']).to_pydatetime(), asset['Type'], config.DEPRECIATION_METHOD)
                 dep_df = pd.DataFrame({"Date": dates, "Value": values})
                 
                 with st.expander("📉 Depreciation Curve"):
-                    fig = px.line(dep_df, x="Date", y="Value", markers=True)
+                    fig = load("plotly.express").line(dep_df, x="Date", y="Value", markers=True)
                     st.plotly_chart(fig, use_container_width=True)
             except Exception as e:
                 st.caption("Depreciation unavailable (Invalid Data)")
@@ -215,26 +137,43 @@ def show_asset_dialog(asset, user_scope, db):
                         db.add_transaction(asset['ID'], st.session_state.username, "CHECKOUT", assignee=new_assign)
                         st.rerun()
 
+        with st.expander("📜 Custody History"):
+            history = db.get_asset_history(asset['ID'])
+            if history: st.dataframe(pd.DataFrame(history).drop(columns=["Asset Serial", "Asset Model"]), hide_index=True, use_container_width=True)
+            else: st.caption("No transactions recorded.")
+
+        with st.expander("🕓 Scan History"):
+            scans = db.get_scan_history(asset['ID'])
+            if scans: st.dataframe(pd.DataFrame(scans), hide_index=True, use_container_width=True)
+            else: st.caption("No scans recorded.")
+
     with d_tab2:
         st.write("**Documents & Photos**")
         if user_scope != config.SCOPE_READ_ONLY:
             uploaded_file = st.file_uploader("Add Attachment", key=f"up_{asset['ID']}")
             if uploaded_file:
                 if st.button("Save File", key=f"save_{asset['ID']}"):
-                    file_path = os.path.join(ATTACHMENTS_DIR, f"{asset['ID']}_{uploaded_file.name}")
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                    db.save_attachment(asset['ID'], uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type, st.session_state.username)
                     st.success("File Saved!")
                     time.sleep(1); st.rerun()
             st.divider()
         
-        files = [f for f in os.listdir(ATTACHMENTS_DIR) if f.startswith(f"{asset['ID']}_")]
+        files = db.get_attachments(asset['ID'])
         if files:
-            for f_name in files:
-                clean_name = f_name.replace(f"{asset['ID']}_", "")
-                f_path = os.path.join(ATTACHMENTS_DIR, f_name)
-                with open(f_path, "rb") as f:
-                    st.download_button(label=f"⬇️ {clean_name}", data=f, file_name=clean_name, key=f"dl_{f_name}")
+            thumbs = db.get_thumbnails({att['Hash'] for att in files})
+            for att in files:
+                c_thumb, c_dl, c_meta = st.columns([1, 3, 2])
+                status, preview = thumbs.get(att['Hash'], (None, None))
+                if preview: c_thumb.image(preview, use_container_width=True)
+                elif status is None and att['Mime'].startswith(("image/", "application/pdf")): c_thumb.caption("⏳ preview")
+                else: c_thumb.write("📄")
+                # File bytes are only read once someone asks for this file
+                ready_key = f"dl_ready_{att['ID']}"
+                if st.session_state.get(ready_key):
+                    c_dl.download_button(label=f"⬇️ Save {att['Name']}", data=db.read_attachment(att['Hash']), file_name=att['Name'], mime=att['Mime'], key=f"dl_{att['ID']}", on_click=st.session_state.pop, args=(ready_key, None))
+                else:
+                    c_dl.button(f"📥 {att['Name']}", key=f"get_{att['ID']}", on_click=st.session_state.__setitem__, args=(ready_key, True))
+                c_meta.caption(f"{att['Size'] / 1024:,.0f} KB · {att['Created']:%Y-%m-%d}")
         else:
             st.info("No attachments found.")
 
@@ -257,73 +196,119 @@ def show_asset_dialog(asset, user_scope, db):
 def show_dashboard(db, user_scope):
     st.title("📊 Command Center")
     total, value, types, tags_list, _ = db.get_stats()
-    assets, total_filtered = db.get_all_assets()
     
-    c1, c2, c3, c4 = st.columns(4)
+    c1, c2, c3, c4, c5 = st.columns(5)
     c1.metric("Total Assets", total)
     c2.metric("Portfolio Value", f"${value:,.2f}")
-    c3.metric("Categories", types)
+    book = db.memoize(("book_value", config.DEPRECIATION_METHOD, datetime.now().date()), lambda: depreciation.summary(db.get_depreciation_inputs(), method=config.DEPRECIATION_METHOD))
+    c3.metric("Book Value", f"${book['book_value']:,.2f}", delta=f"-${book['depreciation']:,.2f}", delta_color="off")
+    c4.metric("Categories", types)
     
-    new_this_month = 0
-    if assets:
-        df_temp = pd.DataFrame(assets)
-        if 'Date Added' in df_temp.columns:
-            df_temp['Date Added'] = pd.to_datetime(df_temp['Date Added'], errors='coerce')
-            now = datetime.now()
-            new_this_month = len(df_temp[(df_temp['Date Added'].dt.month == now.month) & (df_temp['Date Added'].dt.year == now.year)])
-    
-    c4.metric("New (Month)", new_this_month)
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    c5.metric("New (Month)", db.count_added_since(month_start))
     st.markdown("---")
 
     t1, t2 = st.tabs(["📈 Intelligence", "📋 Operational Data"])
     
     with t1:
-        if assets:
-            df_analytics = pd.DataFrame(assets)
+        if total:
             c_chart1, c_chart2 = st.columns([2, 1])
             with c_chart1:
                 st.subheader("Asset Distribution")
-                if 'Type' in df_analytics.columns and 'Make' in df_analytics.columns:
-                    fig_tree = px.treemap(df_analytics, path=[px.Constant("All Assets"), 'Type', 'Make'], title="Hierarchy")
-                    st.plotly_chart(fig_tree, use_container_width=True)
+                cached_chart(db, ("tree",), lambda px: px.treemap(pd.DataFrame(db.get_type_make_counts()), path=[px.Constant("All Assets"), 'Type', 'Make'], values='Count', title="Hierarchy"))
             with c_chart2:
                 st.subheader("Availability")
-                if 'Assigned To' in df_analytics.columns:
-                    df_analytics['Status_Simple'] = df_analytics['Assigned To'].apply(lambda x: 'Available' if x == 'Available' or not x else 'Assigned')
-                    fig_pie = px.pie(df_analytics, names='Status_Simple', hole=0.4, title="Custody")
-                    st.plotly_chart(fig_pie, use_container_width=True)
+                cached_chart(db, ("custody",), lambda px: px.pie(pd.DataFrame(db.get_custody_counts()), names='Status', values='Count', hole=0.4, title="Custody"))
             
             st.divider()
             st.subheader("Financial Overview")
-            if 'Price' in df_analytics.columns:
-                df_val = df_analytics.groupby('Type')['Price'].sum().reset_index()
-                fig_bar = px.bar(df_val, x='Price', y='Type', orientation='h', title="Total Value by Type", text_auto='.2s')
-                st.plotly_chart(fig_bar, use_container_width=True)
+            c_val, c_growth = st.columns(2)
+            with c_val:
+                cached_chart(db, ("value",), lambda px: px.bar(pd.DataFrame(db.get_value_by_type()), x='Price', y='Type', orientation='h', title="Total Value by Type", text_auto='.2s'))
+            with c_growth:
+                additions = db.get_additions_by_month()
+                if additions:
+                    cached_chart(db, ("growth",), lambda px: px.bar(pd.DataFrame(additions), x='Month', y='Added', title="Additions per Month"))
+
+            st.divider()
+            st.subheader("Book Value")
+            b1, b2, b3 = st.columns(3)
+            as_of = b1.date_input("As of", value=datetime.now().date())
+            method_label = b2.selectbox("Method", list(depreciation.METHODS), index=list(depreciation.METHODS.values()).index(config.DEPRECIATION_METHOD))
+            group_by = b3.radio("Group by", ["Type", "Building"], horizontal=True)
+            as_of_dt = datetime.combine(as_of, datetime.max.time())
+            book_rows = depreciation.report(db.get_depreciation_inputs(), as_of_dt, depreciation.METHODS[method_label], group_by)
+            if book_rows:
+                df_book = pd.DataFrame(book_rows)
+                totals = df_book[["Cost", "Book Value", "Depreciation"]].sum()
+                st.caption(f"As of {as_of}: cost ${totals['Cost']:,.2f} · book value ${totals['Book Value']:,.2f} · depreciated ${totals['Depreciation']:,.2f}")
+                st.dataframe(df_book, use_container_width=True, hide_index=True, column_config={c: st.column_config.NumberColumn(format="$%.2f") for c in ["Cost", "Book Value", "Depreciation"]})
+                st.download_button("⬇ Book Value Report (CSV)", data=df_book.to_csv(index=False).encode('utf-8'), file_name=f"book_value_{group_by.lower()}_{as_of}.csv", mime="text/csv")
+
+            st.divider()
+            st.subheader("Scan Health")
+            health_rows = db.get_health_by_building()
+            if health_rows:
+                df_health = pd.DataFrame(health_rows).fillna({"Building": "Unassigned"})
+                fig_health = load("plotly.express").bar(df_health, x='Building', y=['Healthy', 'Stale', 'Never Scanned'], title=f"Health by Building (stale after {config.STALE_AFTER_DAYS} days)", color_discrete_sequence=["#2ecc71", "#e67e22", "#e74c3c"])
+                st.plotly_chart(fig_health, use_container_width=True)
+            stale_count = db.count_stale_assets()
+            with st.expander(f"🔴 Stale Assets ({stale_count})"):
+                stale = db.get_stale_assets(limit=200)
+                if stale:
+                    st.dataframe(pd.DataFrame(stale)[['Serial', 'Type', 'Make', 'Model', 'Building', 'Room', 'Assigned To', 'Last Scanned']], use_container_width=True, hide_index=True)
+                    if stale_count > len(stale): st.caption(f"Showing the {len(stale)} longest-unscanned assets.")
+                else:
+                    st.success("Every asset has been scanned recently.")
         else:
             st.info("No data available.")
 
     with t2:
-        c_search, c_filter, c_exp = st.columns([2, 1, 1])
+        c_search, c_filter, c_sort, c_exp = st.columns([2, 1, 1, 1])
         search = c_search.text_input("🔍 Search", placeholder="Serial, Model...")
-        tag_f = c_filter.selectbox("Tag Filter", ["All"] + tags_list)
+        tag_f = c_filter.multiselect("Tag Filter", tags_list, placeholder="All")
+        tag_mode = "all" if c_filter.toggle("Match all tags", disabled=len(tag_f) < 2) else "any"
+        sort_by = c_sort.selectbox("Sort By", list(SORT_KEYS))
+        descending = c_sort.toggle("Descending", value=True)
         
         PAGE_SIZE = 50
-        if 'page' not in st.session_state: st.session_state.page = 0
+        # Keyset paging: page_cursors[i] is the cursor that starts page i; reset when the view changes
+        view_key = (tuple(tag_f), search, tag_mode, sort_by, descending)
+        if st.session_state.get('page_view') != view_key:
+            st.session_state.page_view = view_key
+            st.session_state.page = 0
+            st.session_state.page_cursors = [None]
         
-        def apply_health(last_scanned):
-            emoji, _, _ = get_asset_health(last_scanned)
-            return emoji
-
-        filtered_assets, count_filtered = db.get_all_assets(tag_f if tag_f != "All" else None, search if search else None, limit=PAGE_SIZE, offset=st.session_state.page * PAGE_SIZE)
+        filtered_assets, next_cursor = db.get_assets_page(tag_f or None, search if search else None, sort_by=sort_by, descending=descending, after=st.session_state.page_cursors[st.session_state.page], limit=PAGE_SIZE, tag_mode=tag_mode)
+        count_filtered, is_estimate = db.count_assets(tag_f or None, search if search else None, tag_mode=tag_mode, estimate_over=config.COUNT_ESTIMATE_OVER)
         
-        if c_exp.button("⬇ Export CSV"):
-            all_assets_export, _ = db.get_all_assets(tag_f if tag_f != "All" else None, search if search else None)
-            csv = pd.DataFrame(all_assets_export).to_csv(index=False).encode('utf-8')
-            st.download_button("Download CSV", data=csv, file_name="full_export.csv", mime="text/csv")
+        if c_exp.button("🖨️ QR Labels (All Results)"):
+            with st.spinner(f"Rendering {count_filtered:,} labels..."):
+                label_rows = db.get_label_rows(tag_f or None, search if search else None, tag_mode=tag_mode)
+                pdf_data = load("labels").qr_sheet(label_rows)
+            st.download_button(f"⬇ Download {len(label_rows):,} Labels", data=pdf_data, file_name="qr_stickers_all.pdf", mime="application/pdf")
+        with c_exp.popover("⬇ Export"):
+            exp = load("exporter")
+            exp_fmt = st.radio("Format", list(exp.FORMATS), key="export_fmt")
+            if st.button("▶ Export Results", key="export_go"):
+                exp_status = st.empty()
+                try:
+                    report = exp.export_assets(db, exp_fmt, tag_f or None, search if search else None, tag_mode,
+                                               progress=lambda n, secs: exp_status.caption(f"{n:,} rows ({n / secs if secs else 0:,.0f} rows/s)"))
+                except (ImportError, ValueError) as e:
+                    st.error(f"Export failed: {e}")
+                else:
+                    exp_status.success(f"{report['rows']:,} rows in {report['seconds']:.1f}s ({report['rows_per_sec']:,.0f} rows/s) → {report['path']}"
+                                       + (f" ({len(report['deleted'])} old exports rotated out)" if report['deleted'] else ""))
+                    if report['bytes'] <= config.EXPORT_DOWNLOAD_MAX_MB * 1048576:
+                        with open(report['path'], "rb") as f:
+                            st.download_button("Download", data=f.read(), file_name=os.path.basename(report['path']), mime=report['mime'])
+                    else:
+                        st.caption(f"{report['bytes'] / 1048576:,.0f} MB is too large for a browser download; open it from the path above.")
 
         if filtered_assets:
             df_filt = pd.DataFrame(filtered_assets)
-            df_filt['Health'] = df_filt['Last Scanned'].apply(apply_health)
+            df_filt['Health'] = health_emojis(df_filt['Last Scanned'])
             cols = ['Health'] + [c for c in df_filt.columns if c != 'Health']
             df_filt = df_filt[cols]
             
@@ -332,9 +317,13 @@ def show_dashboard(db, user_scope):
             p1, p2, p3 = st.columns([1, 8, 1])
             if st.session_state.page > 0:
                 if p1.button("◀ Prev"): st.session_state.page -= 1; st.rerun()
-            if (st.session_state.page + 1) * PAGE_SIZE < count_filtered:
-                if p3.button("Next ▶"): st.session_state.page += 1; st.rerun()
-            p2.caption(f"Showing page {st.session_state.page + 1} of {max(1, (count_filtered // PAGE_SIZE) + 1)}")
+            if next_cursor is not None:
+                if p3.button("Next ▶"):
+                    del st.session_state.page_cursors[st.session_state.page + 1:]
+                    st.session_state.page_cursors.append(next_cursor)
+                    st.session_state.page += 1; st.rerun()
+            total_pages = max(1, -(-count_filtered // PAGE_SIZE))
+            p2.caption(f"Showing page {st.session_state.page + 1} of {total_pages}{'+' if is_estimate else ''} ({count_filtered:,}{'+' if is_estimate else ''} results)")
             
             rows = event.selection.rows
             if len(rows) == 1:
@@ -344,11 +333,26 @@ def show_dashboard(db, user_scope):
                 subset = df_filt.iloc[rows]
                 st.info(f"✅ **{len(rows)} Assets Selected**")
                 if st.button("🖨️ Generate QR Label Sheet (PDF)"):
-                    pdf_data = generate_qr_sheet(subset)
+                    pdf_data = load("labels").qr_sheet(subset.to_dict("records"))
                     st.download_button(label="⬇ Download Sticker Sheet", data=pdf_data, file_name="qr_stickers.pdf", mime="application/pdf")
+                assigned = [filtered_assets[i] for i in rows if filtered_assets[i]['Assigned To'] not in (None, "", "Available")]
+                if assigned:
+                    h1, h2 = st.columns([1, 2])
+                    as_zip = h2.radio("Format", ["Merged PDF", "ZIP"], horizontal=True, key="handover_fmt") == "ZIP"
+                    if h1.button(f"📄 Handover Forms ({len(assigned)})"):
+                        data = load("labels").handover_batch(assigned, as_zip=as_zip)
+                        st.download_button("⬇ Download Handover Forms", data=data, file_name="handover_forms.zip" if as_zip else "handover_forms.pdf", mime="application/zip" if as_zip else "application/pdf")
         else:
             st.warning("No results.")
 
+        with st.expander("📄 Handover Forms by Assignee"):
+            assignees = st.multiselect("Assignees", db.get_assignees())
+            a_zip = st.radio("Format", ["Merged PDF", "ZIP (folder per assignee)"], horizontal=True, key="assignee_handover_fmt") != "Merged PDF"
+            if assignees and st.button("📄 Generate Handover Forms"):
+                batch = db.get_assets_for_assignees(assignees)
+                data = load("labels").handover_batch(batch, as_zip=a_zip)
+                st.download_button(f"⬇ Download {len(batch)} Forms", data=data, file_name="handover_forms.zip" if a_zip else "handover_forms.pdf", mime="application/zip" if a_zip else "application/pdf")
+
 # --- VIEW 2: ADD ASSET ---
 def show_add_asset(db, user_scope):
     st.title("➕ Add New Asset")
@@ -421,8 +425,8 @@ def show_add_asset(db, user_scope):
                     clean_tag = new_tag.strip()
                     if clean_tag not in final_tags: final_tags.append(clean_tag)
                 tag_str = ",".join(final_tags)
-                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                data = (final_type, make, model, serial, "", itec, price, build, room, "", rack, row, table, assign if assign else "Available", tag_str, now, now, "Never")
+                now = datetime.now()
+                data = (final_type, make, model, serial, "", itec, price, build, room, "", rack, row, table, assign if assign else "Available", tag_str, now, now, None)
                 
                 aid = db.add_asset(data)
                 if aid:
@@ -432,39 +436,67 @@ def show_add_asset(db, user_scope):
                 else: st.error("Operation Failed: Duplicate Serial Number detected.")
 
     with tab2:
-        up = st.file_uploader("Upload CSV", type="csv")
-        st.info("CSV Columns must include: type, make, model, serial, price, building, room")
+        up = st.file_uploader("Upload CSV / Excel", type=["csv", "xlsx"])
+        st.info("Columns must include: serial. Optional: type, make, model, price, building, room, stock, itec, class, rack, row, table, assigned, tags")
+        i1, i2 = st.columns(2)
+        imp_mode = i1.radio("Existing serials", ["Reject (insert only)", "Update (upsert by serial)"], horizontal=True)
+        dry_run = i2.checkbox("Dry run (validate only, nothing is saved)")
         if up and st.button("Import"):
             try:
-                df = pd.read_csv(up)
-                df.columns = [c.lower().strip() for c in df.columns]
-                cnt = 0
-                for _, r in df.iterrows():
-                    if 'serial' in r and not pd.isna(r['serial']):
-                        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        data = (r.get('type','Unknown'), r.get('make','Gen'), r.get('model','Gen'), str(r['serial']), "", "", r.get('price',0), r.get('building','Main'), r.get('room','000'), "Imported", "", "", "", r.get('assigned',''), "", now, now, "Never")
-                        if db.add_asset(data): cnt += 1
-                st.success(f"Imported {cnt} Assets")
+                status = st.empty()
+                report = db.import_assets(up, up.name, st.session_state.username, mode="upsert" if imp_mode.startswith("Update") else "insert", dry_run=dry_run, progress=lambda n: status.caption(f"Processed {n:,} rows..."))
+                verb = "Would import" if dry_run else "Imported"
+                st.success(f"{verb} {report['inserted']:,} new / {report['updated']:,} updated of {report['rows']:,} rows in {report['seconds']:.1f}s")
+                if report["rejected"]:
+                    st.warning(f"{len(report['rejected']):,} rows rejected")
+                    df_rej = pd.DataFrame(report["rejected"])
+                    st.dataframe(df_rej, use_container_width=True, hide_index=True)
+                    st.download_button("⬇ Reject Report (CSV)", data=df_rej.to_csv(index=False).encode('utf-8'), file_name="import_rejects.csv", mime="text/csv")
             except Exception as e: st.error(f"Error: {e}")
 
 # --- VIEW 3: INVENTORY (UPDATED WITH CAMERA) ---
 def show_inventory(db, user_scope):
     st.title("📋 Fast Inventory")
     if 'scanned_session' not in st.session_state: st.session_state.scanned_session = []
+    # Scans wait here (as "Pending" log rows) until a size or time window flushes them in one lookup
+    if 'scan_buffer' not in st.session_state: st.session_state.scan_buffer = []
+    if 'scan_buffer_since' not in st.session_state: st.session_state.scan_buffer_since = 0.0
+
+    def flush_scans():
+        buffer = st.session_state.scan_buffer
+        if not buffer: return
+        st.session_state.scan_buffer = []
+        results = {}
+        for source in dict.fromkeys(src for _, src in buffer):
+            serials = [e["Serial"] for e, src in buffer if src == source]
+            results.update(db.record_scans(serials, st.session_state.username, update=user_scope != config.SCOPE_READ_ONLY, source=source))
+        verified = 0
+        for entry, _ in buffer:
+            asset = results.get(entry["Serial"])
+            if asset:
+                entry.update({"Name": f"{asset['Make']} {asset['Model']}", "Status": "✅ Verified"}); verified += 1
+            else:
+                entry.update({"Name": "Unknown", "Status": "❌ Not Found"})
+        st.toast(f"Verified {verified} of {len(buffer)} scans")
 
-    def on_scan(scan_code):
+    def on_scan(scan_code, source="usb"):
         if scan_code:
-            # Check if duplicates in session? Optional.
-            # Processing
-            asset = db.get_asset_by_serial(scan_code)
             ts = datetime.now().strftime("%H:%M:%S")
-            if asset:
-                if user_scope != config.SCOPE_READ_ONLY: db.update_scan_time(scan_code)
-                st.session_state.scanned_session.insert(0, {"Time": ts, "Serial": scan_code, "Name": f"{asset['Make']} {asset['Model']}", "Status": "✅ Verified"})
-                st.toast(f"Verified: {asset['Make']}")
-            else:
-                st.session_state.scanned_session.insert(0, {"Time": ts, "Serial": scan_code, "Name": "Unknown", "Status": "❌ Not Found"})
-                st.toast(f"Unknown: {scan_code}")
+            entry = {"Time": ts, "Serial": scan_code, "Name": "", "Status": "⏳ Pending"}
+            st.session_state.scanned_session.insert(0, entry)
+            if not st.session_state.scan_buffer: st.session_state.scan_buffer_since = time.monotonic()
+            st.session_state.scan_buffer.append((entry, source))
+            if len(st.session_state.scan_buffer) >= config.SCAN_FLUSH_SIZE or time.monotonic() - st.session_state.scan_buffer_since >= config.SCAN_FLUSH_SECONDS:
+                flush_scans()
+
+    @st.fragment(run_every=config.SCAN_FLUSH_SECONDS)
+    def scan_flush_timer():
+        # Flushes a quiet buffer once the time window passes, then redraws the log
+        if st.session_state.scan_buffer and time.monotonic() - st.session_state.scan_buffer_since >= config.SCAN_FLUSH_SECONDS:
+            flush_scans()
+            st.rerun()
+
+    scan_flush_timer()
 
     c_input, c_report = st.columns([2, 1])
     with c_input:
@@ -482,18 +514,65 @@ def show_inventory(db, user_scope):
         # FIX: Camera Input Logic
         cam = st.camera_input("Scan QR/Barcode")
         if cam:
-            bytes_data = cam.getvalue()
-            cv_image = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_COLOR)
-            decoded_objects = decode(cv_image)
-            if decoded_objects:
-                for obj in decoded_objects:
-                    d_data = obj.data.decode("utf-8")
-                    st.success(f"Detected: {d_data}")
+            decoded = load("decoder").decode_frame(cam.getvalue())
+            timing = " · ".join(f"{k} {v:.0f} ms" for k, v in decoded["timings"].items())
+            if decoded["codes"]:
+                for d_data, symbology in decoded["codes"]:
+                    st.success(f"Detected: {d_data} ({symbology})")
                     if st.button(f"Process {d_data}", key=f"proc_{d_data}"):
-                         on_scan(d_data)
+                         on_scan(d_data, "webcam")
                          st.rerun()
+                st.caption(f"Decoded at stage '{decoded['stage']}' · {timing}")
             else:
-                st.caption("No barcode detected in image.")
+                st.caption(f"No barcode detected in image. ({timing})")
+
+        st.write("👉 **Scan Method 3: Batch Upload**")
+        with st.expander("📦 Photo ZIP or Walk-through Video"):
+            batch_file = st.file_uploader("ZIP of photos or a video", type=["zip", "mp4", "mov", "avi", "mkv", "m4v"], key="batch_scan_file")
+            locations = db.get_locations()
+            e1, e2 = st.columns(2)
+            exp_building = e1.selectbox("Expected building (for missed items)", ["(none)"] + list(locations))
+            exp_room = e2.selectbox("Room", ["(all)"] + locations.get(exp_building, []), disabled=exp_building == "(none)")
+            if batch_file and st.button("▶ Decode & Verify"):
+                dec = load("decoder")
+                status_line = st.empty()
+                video_path = None
+                try:
+                    if batch_file.name.lower().endswith(".zip"):
+                        frames = dec.iter_zip_frames(batch_file)
+                    else:
+                        # OpenCV reads video from a path, not a buffer
+                        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(batch_file.name)[1], delete=False) as tmp:
+                            tmp.write(batch_file.getbuffer())
+                            video_path = tmp.name
+                        frames = dec.iter_video_frames(video_path)
+                    decoded = dec.decode_batch(frames, progress=lambda n: status_line.caption(f"Decoded {n} frames..."))
+                finally:
+                    if video_path and os.path.exists(video_path): os.remove(video_path)
+
+                # One bulk lookup (and scan-event insert) for every distinct payload
+                results = db.record_scans(list(decoded["codes"]), st.session_state.username, update=user_scope != config.SCOPE_READ_ONLY, source="batch")
+                ts = datetime.now().strftime("%H:%M:%S")
+                for serial, asset in results.items():
+                    st.session_state.scanned_session.insert(0, {"Time": ts, "Serial": serial, "Name": f"{asset['Make']} {asset['Model']}" if asset else "Unknown", "Status": "✅ Verified" if asset else "❌ Not Found"})
+
+                expected = db.get_assets_at(exp_building, None if exp_room == "(all)" else exp_room) if exp_building != "(none)" else []
+                rows = [{"Result": "Found" if asset else "Unknown", "Serial": serial, "Name": f"{asset['Make']} {asset['Model']}" if asset else "", "Frames": ", ".join(decoded["codes"][serial][:5])} for serial, asset in results.items()]
+                rows += [{"Result": "Missed", "Serial": a["Serial"], "Name": f"{a['Make']} {a['Model']}", "Frames": f"{a['Building']} / {a['Room']}"} for a in expected if not results.get(a["Serial"])]
+                st.session_state.batch_report = {"rows": rows, "frames": decoded["frames"], "empty": len(decoded["empty"]), "seconds": decoded["seconds"]}
+                status_line.empty()
+
+            report = st.session_state.get("batch_report")
+            if report:
+                df_batch = pd.DataFrame(report["rows"], columns=["Result", "Serial", "Name", "Frames"])
+                counts = df_batch["Result"].value_counts()
+                b1, b2, b3 = st.columns(3)
+                b1.metric("Found", int(counts.get("Found", 0)))
+                b2.metric("Unknown", int(counts.get("Unknown", 0)))
+                b3.metric("Missed", int(counts.get("Missed", 0)))
+                st.caption(f"{report['frames']} frames in {report['seconds']:.1f}s ({report['empty']} without a code)")
+                st.dataframe(df_batch, hide_index=True, use_container_width=True)
+                st.download_button("⬇ Batch Report (CSV)", data=df_batch.to_csv(index=False).encode('utf-8'), file_name=f"batch_scan_{datetime.now().strftime('%Y%m%d_%H%M')}.csv", mime="text/csv")
 
         st.write("---")
         st.subheader("Live Session Log")
@@ -519,12 +598,18 @@ def show_inventory(db, user_scope):
         else:
             st.caption("Scan assets to generate a report.")
 
+        with st.expander("📅 Scan Activity (7 days)"):
+            # Day-aligned so reruns share one cached report
+            activity = db.get_scan_counts(datetime.combine(datetime.now().date() - timedelta(days=7), datetime.min.time()))
+            if activity: st.dataframe(pd.DataFrame(activity), hide_index=True, use_container_width=True)
+            else: st.caption("No scans in the last week.")
+
 # --- VIEW 4: ADMIN ---
 def show_admin(db, user_scope):
     st.title("🛡️ Admin Panel")
     if user_scope != config.SCOPE_ADMIN: st.error("Denied: Admin Access Required"); return
     
-    t1, t2, t3 = st.tabs(["👥 User Management", "📜 Audit Log", "✏️ Bulk Asset Edit"])
+    t1, t2, t3, t4 = st.tabs(["👥 User Management", "📜 Audit Log", "✏️ Bulk Asset Edit", "🧰 Maintenance"])
     
     with t1:
         u_tab1, u_tab2 = st.tabs(["Create User", "Manage Existing Users"])
@@ -563,10 +648,42 @@ def show_admin(db, user_scope):
                         else: db.delete_user(uid); st.success(f"Deleted {uname}"); st.rerun()
 
     with t2:
-        logs = db.get_all_transactions()
+        users, actions = db.get_audit_filters()
+        f1, f2, f3, f4 = st.columns(4)
+        f_user = f1.selectbox("User", ["All"] + users)
+        f_action = f2.selectbox("Action", ["All"] + actions)
+        f_serial = f3.text_input("Asset Serial", placeholder="Exact serial")
+        f_dates = f4.date_input("Date Range", value=(), help="Leave empty for all time")
+
+        LOG_PAGE_SIZE = 200
+        f_asset = None
+        if f_serial:
+            f_asset = db.get_ids_by_serial([f_serial.strip()]).get(f_serial.strip(), -1)
+        f_start = datetime.combine(f_dates[0], datetime.min.time()) if len(f_dates) > 0 else None
+        f_end = datetime.combine(f_dates[1], datetime.min.time()) + timedelta(days=1) if len(f_dates) > 1 else None
+        log_key = (f_user, f_action, f_serial, tuple(f_dates))
+        if st.session_state.get('log_view') != log_key:
+            st.session_state.log_view = log_key
+            st.session_state.log_page = 0
+            st.session_state.log_cursors = [None]
+
+        logs, log_next = db.get_transactions_page(
+            user=None if f_user == "All" else f_user, action=None if f_action == "All" else f_action,
+            asset_id=f_asset, start=f_start, end=f_end,
+            before=st.session_state.log_cursors[st.session_state.log_page], limit=LOG_PAGE_SIZE)
         if logs:
             df = pd.DataFrame(logs)
             st.dataframe(df, use_container_width=True)
+            l1, l2, l3 = st.columns([1, 8, 1])
+            if st.session_state.log_page > 0:
+                if l1.button("◀ Newer"): st.session_state.log_page -= 1; st.rerun()
+            if log_next is not None:
+                if l3.button("Older ▶"):
+                    del st.session_state.log_cursors[st.session_state.log_page + 1:]
+                    st.session_state.log_cursors.append(log_next)
+                    st.session_state.log_page += 1; st.rerun()
+            l2.caption(f"Page {st.session_state.log_page + 1} ({len(logs)} entries)")
+            px = load("plotly.express")
             c_log1, c_log2 = st.columns(2)
             with c_log1:
                 st.caption("Activity by User")
@@ -579,27 +696,192 @@ def show_admin(db, user_scope):
         else: st.info("No Audit Logs found.")
 
     with t3:
-        with open(config.DB_NAME, "rb") as fp:
-            st.download_button("💾 Backup Database", fp, "backup.db", type="primary")
-
-        st.info("⚠️ Admin Mode: Direct Database Edits. Changes are final.")
-        assets_data, _ = db.get_all_assets()
-        
-        if assets_data:
-            df_edit = pd.DataFrame(assets_data)
-            edited_df = st.data_editor(df_edit, key="edit_bulk", disabled=["ID", "Date Added", "Last Modified"], num_rows="fixed", use_container_width=True)
-            
-            if st.button("💾 Save Bulk Changes", type="primary"):
-                p_bar = st.progress(0)
-                total_rows = len(edited_df)
-                errors = 0
-                try:
-                    for i, r in edited_df.iterrows():
-                        # FIX: Using new Dict Logic in Database
-                        row_dict = r.to_dict()
-                        if not db.update_asset_dict(row_dict['ID'], row_dict): errors += 1
-                        p_bar.progress((i + 1) / total_rows)
-                    if errors == 0: st.success("Database successfully updated!")
-                    else: st.warning(f"Updated with {errors} errors.")
+        st.info("⚠️ Admin Mode: Direct Database Edits. Changes are final once saved.")
+        # Windowed editing: only one window of the filtered assets is in the grid at a time.
+        # Edits from every window collect in edit_buffer {asset_id: {column: value}} and are
+        # written together by Save.
+        if 'edit_buffer' not in st.session_state: st.session_state.edit_buffer = {}
+        if 'edit_generation' not in st.session_state: st.session_state.edit_generation = 0
+        buffer = st.session_state.edit_buffer
+
+        type_names = [r["Type"] for r in db.get_type_stats()]
+        e1, e2, e3 = st.columns(3)
+        f_building = e1.selectbox("Building", ["All"] + list(db.get_locations()), key="edit_building")
+        f_type = e2.selectbox("Type", ["All"] + type_names, key="edit_type", format_func=lambda t: t or "(none)")
+        f_tags = e3.multiselect("Tags", db.get_tags(), placeholder="All", key="edit_tags")
+        win_filters = (None if f_building == "All" else f_building, None if f_type == "All" else f_type, f_tags or None)
+
+        filter_key = (f_building, f_type, tuple(f_tags))
+        if st.session_state.get('edit_view') != filter_key:
+            st.session_state.edit_view = filter_key
+            st.session_state.edit_page = 0
+            st.session_state.edit_cursors = [None]
+        page = st.session_state.edit_page
+        window_key = (filter_key, page, st.session_state.edit_generation)
+
+        # The grid's input frame is built once per window so the editor's own state stays valid
+        # across reruns; revisiting a window re-applies its pending edits from the buffer.
+        if st.session_state.get('edit_window', {}).get("key") != window_key:
+            rows, next_id = db.get_edit_window(*win_filters, after=st.session_state.edit_cursors[page], limit=config.BULK_EDIT_WINDOW)
+            base = pd.DataFrame(rows)
+            shown = base.copy()
+            if rows:
+                position = {asset_id: i for i, asset_id in enumerate(base["ID"])}
+                for asset_id, cells in buffer.items():
+                    if asset_id in position:
+                        for col, value in cells.items(): shown.at[position[asset_id], col] = value
+            st.session_state.edit_window = {"key": window_key, "base": base, "shown": shown, "next": next_id}
+        window = st.session_state.edit_window
+        total = db.count_edit_window(*win_filters)
+
+        if not window["base"].empty:
+            edited_df = st.data_editor(window["shown"], key=f"edit_bulk_{window_key}", disabled=["ID", "Date Added", "Last Modified"], num_rows="fixed", use_container_width=True, hide_index=True)
+            # This window's entries in the buffer are replaced by its current diff, so a cell
+            # edited back to its stored value drops out of the pending changes
+            for asset_id in window["base"]["ID"]: buffer.pop(int(asset_id), None)
+            buffer.update(diff_asset_frames(window["base"], edited_df))
+
+            w1, w2, w3 = st.columns([1, 8, 1])
+            if page > 0:
+                if w1.button("◀ Prev", key="edit_prev"): st.session_state.edit_page -= 1; st.rerun()
+            if window["next"] is not None:
+                if w3.button("Next ▶", key="edit_next"):
+                    del st.session_state.edit_cursors[page + 1:]
+                    st.session_state.edit_cursors.append(window["next"])
+                    st.session_state.edit_page += 1; st.rerun()
+            first = page * config.BULK_EDIT_WINDOW
+            w2.caption(f"Assets {first + 1:,}–{first + len(window['base']):,} of {total:,}")
+        else:
+            st.caption("No assets match these filters.")
+
+        n_cells = sum(len(cells) for cells in buffer.values())
+        if buffer:
+            with st.expander(f"📝 Pending changes: {n_cells} cells on {len(buffer)} assets"):
+                st.dataframe(pd.DataFrame([{"ID": asset_id, "Column": col, "New Value": str(value)}
+                                           for asset_id, cells in sorted(buffer.items()) for col, value in cells.items()]), hide_index=True, use_container_width=True)
+        s1, s2 = st.columns([1, 1])
+        if s1.button("💾 Save Bulk Changes", type="primary", disabled=not buffer):
+            try:
+                result = db.apply_asset_changes(dict(buffer))
+            except Exception as e: st.error(f"Error updating database: {e}")
+            else:
+                # Saved rows leave the buffer; rejected ones stay pending so they can be fixed
+                for asset_id in result["changed"]: buffer.pop(asset_id, None)
+                st.session_state.edit_generation += 1
+                if result["rejected"]:
+                    st.warning(f"Updated {len(result['changed'])} assets, {len(result['rejected'])} rejected.")
+                    st.dataframe(pd.DataFrame([{"ID": k, "Reason": v} for k, v in result["rejected"].items()]), hide_index=True)
+                else:
+                    st.success(f"Database successfully updated! ({len(result['changed'])} assets changed)")
                     time.sleep(1); st.rerun()
-                except Exception as e: st.error(f"Error updating database: {e}")
\ No newline at end of file
+        if s2.button("↩️ Discard Changes", disabled=not buffer):
+            buffer.clear()
+            st.session_state.edit_generation += 1
+            st.rerun()
+
+    with t4:
+        st.subheader("Summary Statistics")
+        st.caption("Dashboard totals are kept up to date on every write. Rebuild them if they ever drift from the asset table.")
+        type_stats = db.get_type_stats()
+        if type_stats: st.dataframe(pd.DataFrame(type_stats), use_container_width=True, hide_index=True, column_config={"Value": st.column_config.NumberColumn(format="$%.2f")})
+        if st.button("♻️ Rebuild Stats"):
+            n_types = db.rebuild_stats()
+            st.success(f"Stats rebuilt ({n_types} device types)."); time.sleep(1); st.rerun()
+
+        st.divider()
+        st.subheader("Database Engine")
+        e1, e2 = st.columns(2)
+        with e1:
+            st.caption("Connection profile")
+            st.dataframe(pd.DataFrame(list(db.get_engine_profile().items()), columns=["Pragma", "Value"]), hide_index=True, use_container_width=True)
+        with e2:
+            st.caption("Write queue")
+            w = db.writer.stats
+            st.write(f"{w['jobs']:,} writes in {w['batches']:,} commits ({w['replays']} replayed batches)")
+            st.caption("Scheduled jobs (intervals from config)")
+            schedule = {name: getattr(config, key) for name, (key, _, _) in MAINTENANCE_TASKS.items()}
+            runs = db.maintenance.history
+            st.dataframe(pd.DataFrame([{"Task": k, "Every (s)": v, **{c: runs.get(k, {}).get(c, "") for c in ["Last Run", "Seconds", "Status"]}} for k, v in schedule.items()]), hide_index=True, use_container_width=True)
+            task = st.selectbox("Run now", list(schedule))
+            if st.button("▶ Run Maintenance Task"):
+                res = db.run_maintenance(task)
+                st.success(f"{task}: {res['Status']} in {res['Seconds']}s")
+
+        st.divider()
+        st.subheader("Query Cache")
+        info = db.cache.info()
+        q1, q2, q3, q4 = st.columns(4)
+        q1.metric("Hit Rate", f"{info['hit_rate']:.0%}")
+        q2.metric("Hits / Misses", f"{info['hits']:,} / {info['misses']:,}")
+        q3.metric("Entries", f"{info['entries']} / {config.CACHE_MAX_ENTRIES}")
+        q4.metric("Memory", f"{info['bytes'] / 1048576:.1f} / {config.CACHE_MAX_MB} MB")
+        st.caption(f"Data revision {info['revision']} · {info['invalidations']} invalidations · {info['evictions']} evictions")
+        # Read only if labels is already imported; showing stats shouldn't pull in qrcode/fpdf
+        labels_mod = sys.modules.get("labels")
+        if labels_mod:
+            qr = labels_mod.qr_cache_info()
+            st.caption(f"QR codes: {qr['hits']:,} reused / {qr['misses']:,} encoded · {qr['entries']:,} / {config.QR_CACHE_SIZE:,} cached")
+        else:
+            st.caption("QR codes: none encoded since startup")
+        if st.button("🧹 Clear Cache"):
+            db.cache.clear(); st.rerun()
+
+        st.divider()
+        st.subheader("Attachment Store")
+        a_stats = db.get_attachment_stats()
+        st.caption(f"{a_stats['files']:,} attachments in {a_stats['blobs']:,} stored files · {a_stats['stored_bytes'] / 1048576:,.1f} MB on disk ({(a_stats['bytes'] - a_stats['stored_bytes']) / 1048576:,.1f} MB saved by de-duplication)")
+
+        st.divider()
+        st.subheader("Backups")
+        st.caption(f"Online snapshots taken with the SQLite backup API while the app keeps running, integrity-checked and gzip-compressed into `{config.BACKUP_DIR}/` (newest {config.BACKUP_KEEP} kept).")
+        if st.button("💾 Backup Database", type="primary"):
+            bk_status = st.empty()
+            try:
+                run = backup.create_backup(progress=lambda done, pages: bk_status.progress(done / pages if pages else 1.0, text=f"{done:,} / {pages:,} pages"))
+            except (OSError, ValueError, sqlite3.Error) as e:
+                bk_status.error(f"Backup failed: {e}")
+            else:
+                bk_status.success(f"Snapshot written in {run['seconds']:.2f}s: {run['db_bytes'] / 1048576:,.1f} MB database → {run['bytes'] / 1048576:,.1f} MB compressed"
+                                  + (f" ({len(run['deleted'])} old snapshots rotated out)" if run['deleted'] else ""))
+        snapshots = backup.list_backups()
+        if snapshots:
+            st.dataframe(pd.DataFrame(snapshots).drop(columns=["path", "mtime"]), hide_index=True, use_container_width=True)
+            pick = st.selectbox("Snapshot", [snap["Name"] for snap in snapshots])
+            chosen = next(snap for snap in snapshots if snap["Name"] == pick)
+            b1, b2 = st.columns(2)
+            with b1:
+                if chosen["MB"] <= config.EXPORT_DOWNLOAD_MAX_MB:
+                    # Tabs all render on every rerun: the snapshot is only read once someone asks for it
+                    ready_key = f"backup_ready_{pick}"
+                    if st.session_state.get(ready_key):
+                        with open(chosen["path"], "rb") as f:
+                            st.download_button(f"⬇️ Save {pick}", f.read(), file_name=pick, mime="application/gzip", key=f"backup_dl_{pick}", on_click=st.session_state.pop, args=(ready_key, None))
+                    else:
+                        st.button("📥 Download Snapshot", key=f"backup_get_{pick}", on_click=st.session_state.__setitem__, args=(ready_key, True))
+                else:
+                    st.caption(f"{chosen['MB']:,.0f} MB is too large for a browser download; copy it from {chosen['path']}.")
+            with b2:
+                confirm = st.checkbox(f"Replace the live database with {pick}")
+                if st.button("⏪ Restore Snapshot", disabled=not confirm):
+                    try:
+                        res = backup.restore_backup(db, chosen["path"])
+                    except (OSError, ValueError, sqlite3.Error) as e:
+                        st.error(f"Restore failed: {e}")
+                    else:
+                        st.success(f"Restored in {res['seconds']:.2f}s. The previous state was saved as {os.path.basename(res['safety'])}.")
+        else:
+            st.caption("No snapshots yet.")
+
+        st.divider()
+        st.subheader("Startup Profile")
+        st.caption("Cold-start cost of this server process: app startup phases, each page's first render, and the libraries loaded lazily along the way.")
+        s1, s2, s3 = st.columns(3)
+        with s1:
+            st.caption("App startup")
+            st.dataframe(pd.DataFrame([{"Phase": k, "Seconds": round(v, 3)} for k, v in STARTUP_TIMES.items()]), hide_index=True, use_container_width=True)
+        with s2:
+            st.caption("First render per page")
+            st.dataframe(pd.DataFrame([{"Page": k, "Seconds": round(v["Seconds"], 3), "Loaded": v["Imports"]} for k, v in VIEW_TIMES.items()]), hide_index=True, use_container_width=True)
+        with s3:
+            st.caption("Lazy imports")
+            st.dataframe(pd.DataFrame([{"Module": k, "Seconds": round(v, 3)} for k, v in IMPORT_TIMES.items()]), hide_index=True, use_container_width=True)
\ No newline at end of file